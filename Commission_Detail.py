@@ -1,110 +1,30 @@
+import datetime
+import json
+import os
+import threading
+from collections import OrderedDict
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html, dash_table, Input, Output
 import pandas as pd
-from sqlalchemy import create_engine
-import urllib
-
-# --- SQL Server Connection ---
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-    f"SERVER={server};DATABASE={database};UID={username};PWD={password};"
-)
-engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
+import pyarrow as pa
+import db
+import snapshots
+import memo
 
 # --- Helper Functions ---
 def format_dollar(value):
     return "${:,.0f}".format(value) if pd.notna(value) else "$0"
 
-def fetch_locations():
-    try:
-        query = """
-            SELECT DISTINCT TRIM([Location]) AS Location FROM (
-                SELECT [Location] FROM [dbo].[MP/MD COMMISSIONS]
-                UNION
-                SELECT [Location] FROM [dbo].[MP as PM COMMISSION]
-                UNION
-                SELECT [Location] FROM [dbo].[PRACTICE_MP]
-                UNION
-                SELECT [Location] FROM [dbo].[3RD_PARTY COMMISSION]
-                UNION
-                SELECT [Location] FROM [dbo].[PRACTICE_MD]
-            ) AS AllLocations
-            WHERE [Location] IS NOT NULL AND TRIM([Location]) <> ''
-        """
-        df = pd.read_sql(query, engine)
-        df['Location'] = df['Location'].str.strip()
-        return [{'label': loc, 'value': loc} for loc in sorted(df['Location'].unique())]
-    except Exception as e:
-        print("Error fetching locations:", e)
-        return []
-
-def fetch_departments():
-    try:
-        query = """
-            SELECT DISTINCT TRIM([Department]) AS Department
-            FROM [dbo].[MP/MD COMMISSIONS]
-            WHERE [Department] IS NOT NULL AND TRIM([Department]) <> ''
-        """
-        df = pd.read_sql(query, engine)
-        df['Department'] = df['Department'].str.strip()
-        return [{'label': dept, 'value': dept} for dept in sorted(df['Department'].unique())]
-    except Exception as e:
-        print("Error fetching departments:", e)
-        return []
-
-def fetch_practice_mps():
-    try:
-        query = """
-            SELECT DISTINCT TRIM([Practice MP Name]) AS PracticeMPName
-            FROM [dbo].[PRACTICE_MP]
-            WHERE [Practice MP Name] IS NOT NULL AND TRIM([Practice MP Name]) <> ''
-        """
-        df = pd.read_sql(query, engine)
-        df['PracticeMPName'] = df['PracticeMPName'].str.strip()
-        return [{'label': mp, 'value': mp} for mp in sorted(df['PracticeMPName'].unique())]
-    except Exception as e:
-        print("Error fetching Practice MP Names:", e)
-        return []
-
-def fetch_practice_mds():
-    try:
-        query = """
-            SELECT DISTINCT TRIM([Practice_MD_Name]) AS PracticeMD
-            FROM [dbo].[PRACTICE_MD]
-            WHERE [Practice_MD_Name] IS NOT NULL AND TRIM([Practice_MD_Name]) <> ''
-        """
-        df = pd.read_sql(query, engine)
-        df['PracticeMD'] = df['PracticeMD'].str.strip()
-        return [{'label': md, 'value': md} for md in sorted(df['PracticeMD'].unique())]
-    except Exception as e:
-        print("Error fetching Practice MDs:", e)
-        return []
-
-def fetch_mp_as_pm():
-    try:
-        query = """
-            SELECT DISTINCT TRIM([MP as PM]) AS MPAsPM
-            FROM [dbo].[MP as PM COMMISSION]
-            WHERE [MP as PM] IS NOT NULL AND TRIM([MP as PM]) <> ''
-        """
-        df = pd.read_sql(query, engine)
-        df['MPAsPM'] = df['MPAsPM'].str.strip()
-        return [{'label': mp, 'value': mp} for mp in sorted(df['MPAsPM'].unique())]
-    except Exception as e:
-        print("Error fetching MP as PM:", e)
-        return []
-
-location_options = fetch_locations()
-department_options = fetch_departments()
-practice_mp_options = fetch_practice_mps()
-practice_md_options = fetch_practice_mds()
-mp_as_pm_options = fetch_mp_as_pm()
+# Dropdown options come from the shared commission_options snapshot (snapshots.py)
+def dropdown_options():
+    return (
+        snapshots.commission_options("location"),
+        snapshots.commission_options("department"),
+        snapshots.commission_options("practice_mp"),
+        snapshots.commission_options("practice_md"),
+        snapshots.commission_options("mp_as_pm"),
+    )
 
 card_style = {
     "backgroundColor": "#2c2c2c",
@@ -116,118 +36,348 @@ card_style = {
     "fontSize": "18px"
 }
 
-layout = html.Div(style={'backgroundColor': '#1e1e1e', 'padding': '20px'}, children=[
-    dbc.Row([
-        dbc.Col([
-            dbc.Row([
-                dbc.Col(html.Div([html.H4(id='kpi-mp'), html.Div("MP Commission")], style=card_style), width=2),
-                dbc.Col(html.Div([html.H4(id='kpi-md'), html.Div("MD Commission")], style=card_style), width=2),
-                dbc.Col(html.Div([html.H4(id='kpi-prac-mp'), html.Div("Practice MP")], style=card_style), width=2),
-                dbc.Col(html.Div([html.H4(id='kpi-prac-md'), html.Div("Practice MD")], style=card_style), width=2),
-                dbc.Col(html.Div([html.H4(id='kpi-mp-as-pm'), html.Div("MP as PM")], style=card_style), width=2),
-                dbc.Col(html.Div([html.H4(id='kpi-3rd-party'), html.Div("3rd Party")], style=card_style), width=2),
-            ], justify='start', style={"flexWrap": "nowrap"}),
-        ], width=9),
-
-        dbc.Col([
-            html.Div([
-                html.H3(id='kpi-total', style={'fontSize': '36px', 'margin': '0'}),
-                html.Div("Total Commission", style={'fontSize': '24px'})
-            ], style=card_style)
-        ], width=3, style={'display': 'flex', 'justifyContent': 'flex-end', 'alignItems': 'center'})
-    ], align='center', justify='between', style={"marginBottom": "30px"}),
-
-    html.Div([
-        dcc.Dropdown(id='year-dropdown', options=[{'label': str(y), 'value': str(y)} for y in range(2022, 2026)],
-                     placeholder="Select Year", style={"width": "180px", "marginRight": "20px", "color": "black"}),
-        dcc.Dropdown(id='month-dropdown', options=[{'label': m, 'value': i+1} for i, m in enumerate([
-            'January', 'February', 'March', 'April', 'May', 'June',
-            'July', 'August', 'September', 'October', 'November', 'December'
-        ])], placeholder="Select Month", style={"width": "180px", "marginRight": "20px", "color": "black"}),
-    ], style={'display': 'flex', 'gap': '10px', 'marginBottom': '30px'}),
-
-    *[
+# Built on demand so the commission options are only read once they are loaded
+def layout():
+    location_options, department_options, practice_mp_options, practice_md_options, mp_as_pm_options = \
+        dropdown_options()
+
+    return html.Div(style={'backgroundColor': '#1e1e1e', 'padding': '20px'}, children=[
+        dbc.Row([
+            dbc.Col([
+                dbc.Row([
+                    dbc.Col(html.Div([html.H4(id='kpi-mp'), html.Div("MP Commission")], style=card_style), width=2),
+                    dbc.Col(html.Div([html.H4(id='kpi-md'), html.Div("MD Commission")], style=card_style), width=2),
+                    dbc.Col(html.Div([html.H4(id='kpi-prac-mp'), html.Div("Practice MP")], style=card_style), width=2),
+                    dbc.Col(html.Div([html.H4(id='kpi-prac-md'), html.Div("Practice MD")], style=card_style), width=2),
+                    dbc.Col(html.Div([html.H4(id='kpi-mp-as-pm'), html.Div("MP as PM")], style=card_style), width=2),
+                    dbc.Col(html.Div([html.H4(id='kpi-3rd-party'), html.Div("3rd Party")], style=card_style), width=2),
+                ], justify='start', style={"flexWrap": "nowrap"}),
+            ], width=9),
+
+            dbc.Col([
+                html.Div([
+                    html.H3(id='kpi-total', style={'fontSize': '36px', 'margin': '0'}),
+                    html.Div("Total Commission", style={'fontSize': '24px'})
+                ], style=card_style)
+            ], width=3, style={'display': 'flex', 'justifyContent': 'flex-end', 'alignItems': 'center'})
+        ], align='center', justify='between', style={"marginBottom": "30px"}),
+
         html.Div([
-            html.H4(title, style={'color': 'white'}),
-            html.Label("Department:" if dropdown_id == 'md-dropdown' else "Managing Partner Name:", style={'color': 'white'}),
-            dcc.Dropdown(
-                id=dropdown_id,
-                options=(department_options if dropdown_id == 'md-dropdown' else
-                         practice_mp_options if dropdown_id == 'practice-mp-dropdown' else
-                         practice_md_options if dropdown_id == 'practice-md-dropdown' else
-                         mp_as_pm_options if dropdown_id == 'mp-as-pm-dropdown' else
-                         location_options),
-                placeholder="Select",
-                style={"width": "250px", "color": "black", "marginBottom": "10px"}
-            ),
-            dash_table.DataTable(id=table_id, columns=columns, style_table={'overflowX': 'auto'},
-                                 style_cell={'backgroundColor': '#2b2b2b', 'color': 'white',
-                                             'border': '1px solid white', 'textAlign': 'left',
-                                             'padding': '5px', 'fontSize': '14px'},
-                                 style_header={'backgroundColor': '#444', 'color': 'white', 'fontWeight': 'bold'})
-        ])
-        for title, dropdown_id, table_id, columns in [
-            ("MP Commission Details", 'mp-dropdown', 'mp-table', [
-                {'name': 'Managing Partner', 'id': 'Location'},
-                {'name': 'Client Name', 'id': 'Client_Name'},
-                {'name': 'Description', 'id': 'Invoice_Description'},
-                {'name': 'Invoice Date', 'id': 'Invoice_Date'},
-                {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
-                {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
-                {'name': 'MP Commission', 'id': 'MP_Commission'},
-                {'name': 'Account Code', 'id': 'AccountCode'}
-            ]),
-            ("MD Commission Details", 'md-dropdown', 'md-table', [
-                {'name': 'Department', 'id': 'Location'},
-                {'name': 'Client Name', 'id': 'Client_Name'},
-                {'name': 'Description', 'id': 'Invoice_Description'},
-                {'name': 'Invoice Date', 'id': 'Invoice_Date'},
-                {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
-                {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
-                {'name': 'MD Commission', 'id': 'MD_Commission'},
-                {'name': 'Account Code', 'id': 'AccountCode'}
-            ]),
-            ("Practice MP Commission Details", 'practice-mp-dropdown', 'practice-mp-table', [
-                {'name': 'Practice MP', 'id': 'Location'},
-                {'name': 'Client Name', 'id': 'Client_Name'},
-                {'name': 'Description', 'id': 'Invoice_Description'},
-                {'name': 'Invoice Date', 'id': 'Invoice_Date'},
-                {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
-                {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
-                {'name': 'Practice MP Commission', 'id': 'MP_Commission'}
-            ]),
-            ("Practice MD Commission Details", 'practice-md-dropdown', 'practice-md-table', [
-                {'name': 'Practice MD', 'id': 'PracticeMD'},
-                {'name': 'Client Name', 'id': 'Client_Name'},
-                {'name': 'Description', 'id': 'Invoice_Description'},
-                {'name': 'Invoice Date', 'id': 'Invoice_Date'},
-                {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
-                {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
-                {'name': 'Practice MD Commission', 'id': 'Practice MD Commission'}
-            ]),
-            ("MP as PM Commission Details", 'mp-as-pm-dropdown', 'mp-as-pm-table', [
-                {'name': 'Managing Partner', 'id': 'Location'},
-                {'name': 'Client Name', 'id': 'Client_Name'},
-                {'name': 'Description', 'id': 'Invoice_Description'},
-                {'name': 'Invoice Date', 'id': 'Invoice_Date'},
-                {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
-                {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
-                {'name': 'MP as PM Commission', 'id': 'MP as PM Commission'}
-            ]),
-            ("3rd Party Commission Details", 'third-party-dropdown', 'third-party-table', [
-                {'name': 'Managing Partner', 'id': 'Location'},
-                {'name': 'Client Name', 'id': 'Client_Name'},
-                {'name': 'Description', 'id': 'Invoice_Description'},
-                {'name': 'Invoice Date', 'id': 'Invoice_Date'},
-                {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
-                {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
-                {'name': '3rd Party Commission', 'id': '3rd Party Payout 1'}
+            dcc.Dropdown(id='year-dropdown', options=[{'label': str(y), 'value': str(y)} for y in range(2022, 2026)],
+                         placeholder="Select Year", style={"width": "180px", "marginRight": "20px", "color": "black"}),
+            dcc.Dropdown(id='month-dropdown', options=[{'label': m, 'value': i+1} for i, m in enumerate([
+                'January', 'February', 'March', 'April', 'May', 'June',
+                'July', 'August', 'September', 'October', 'November', 'December'
+            ])], placeholder="Select Month", style={"width": "180px", "marginRight": "20px", "color": "black"}),
+        ], style={'display': 'flex', 'gap': '10px', 'marginBottom': '30px'}),
+
+        *[
+            html.Div([
+                html.H4(title, style={'color': 'white'}),
+                html.Label("Department:" if dropdown_id == 'md-dropdown' else "Managing Partner Name:", style={'color': 'white'}),
+                dcc.Dropdown(
+                    id=dropdown_id,
+                    options=(department_options if dropdown_id == 'md-dropdown' else
+                             practice_mp_options if dropdown_id == 'practice-mp-dropdown' else
+                             practice_md_options if dropdown_id == 'practice-md-dropdown' else
+                             mp_as_pm_options if dropdown_id == 'mp-as-pm-dropdown' else
+                             location_options),
+                    placeholder="Select",
+                    style={"width": "250px", "color": "black", "marginBottom": "10px"}
+                ),
+                # Detail rows are only read while the table is expanded
+                dbc.Button("Show details", id=f'{table_id}-toggle', color="secondary", size="sm",
+                           style={"marginBottom": "10px"}),
+                dbc.Collapse(
+                    dash_table.DataTable(id=table_id, columns=columns, style_table={'overflowX': 'auto'},
+                                         style_cell={'backgroundColor': '#2b2b2b', 'color': 'white',
+                                                     'border': '1px solid white', 'textAlign': 'left',
+                                                     'padding': '5px', 'fontSize': '14px'},
+                                         style_header={'backgroundColor': '#444', 'color': 'white', 'fontWeight': 'bold'}),
+                    id=f'{table_id}-collapse', is_open=False
+                )
             ])
+            for title, dropdown_id, table_id, columns in [
+                ("MP Commission Details", 'mp-dropdown', 'mp-table', [
+                    {'name': 'Managing Partner', 'id': 'Location'},
+                    {'name': 'Client Name', 'id': 'Client_Name'},
+                    {'name': 'Description', 'id': 'Invoice_Description'},
+                    {'name': 'Invoice Date', 'id': 'Invoice_Date'},
+                    {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
+                    {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
+                    {'name': 'MP Commission', 'id': 'MP_Commission'},
+                    {'name': 'Account Code', 'id': 'AccountCode'}
+                ]),
+                ("MD Commission Details", 'md-dropdown', 'md-table', [
+                    {'name': 'Department', 'id': 'Location'},
+                    {'name': 'Client Name', 'id': 'Client_Name'},
+                    {'name': 'Description', 'id': 'Invoice_Description'},
+                    {'name': 'Invoice Date', 'id': 'Invoice_Date'},
+                    {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
+                    {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
+                    {'name': 'MD Commission', 'id': 'MD_Commission'},
+                    {'name': 'Account Code', 'id': 'AccountCode'}
+                ]),
+                ("Practice MP Commission Details", 'practice-mp-dropdown', 'practice-mp-table', [
+                    {'name': 'Practice MP', 'id': 'Location'},
+                    {'name': 'Client Name', 'id': 'Client_Name'},
+                    {'name': 'Description', 'id': 'Invoice_Description'},
+                    {'name': 'Invoice Date', 'id': 'Invoice_Date'},
+                    {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
+                    {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
+                    {'name': 'Practice MP Commission', 'id': 'MP_Commission'}
+                ]),
+                ("Practice MD Commission Details", 'practice-md-dropdown', 'practice-md-table', [
+                    {'name': 'Practice MD', 'id': 'PracticeMD'},
+                    {'name': 'Client Name', 'id': 'Client_Name'},
+                    {'name': 'Description', 'id': 'Invoice_Description'},
+                    {'name': 'Invoice Date', 'id': 'Invoice_Date'},
+                    {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
+                    {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
+                    {'name': 'Practice MD Commission', 'id': 'Practice MD Commission'}
+                ]),
+                ("MP as PM Commission Details", 'mp-as-pm-dropdown', 'mp-as-pm-table', [
+                    {'name': 'Managing Partner', 'id': 'Location'},
+                    {'name': 'Client Name', 'id': 'Client_Name'},
+                    {'name': 'Description', 'id': 'Invoice_Description'},
+                    {'name': 'Invoice Date', 'id': 'Invoice_Date'},
+                    {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
+                    {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
+                    {'name': 'MP as PM Commission', 'id': 'MP as PM Commission'}
+                ]),
+                ("3rd Party Commission Details", 'third-party-dropdown', 'third-party-table', [
+                    {'name': 'Managing Partner', 'id': 'Location'},
+                    {'name': 'Client Name', 'id': 'Client_Name'},
+                    {'name': 'Description', 'id': 'Invoice_Description'},
+                    {'name': 'Invoice Date', 'id': 'Invoice_Date'},
+                    {'name': 'Invoice Amount', 'id': 'Invoice_Amount'},
+                    {'name': 'Fully Paid On', 'id': 'FullyPaidOnDate'},
+                    {'name': '3rd Party Commission', 'id': '3rd Party Payout 1'}
+                ])
+            ]
         ]
-    ]
-])
+    ])
+
+# --- Commission queries ---
+# One part per table on the page, in page order: (KPI column, name column
+# shown in the table, its heading, column the person filter applies to,
+# source table, whether it has AccountCode). A part's rows are only read
+# once its table is expanded; the KPI cards come from the commission ledger.
+COMMISSION_PARTS = [
+    ("MP_Commission", "Location", "Location", "Location", "[dbo].[MP/MD COMMISSIONS]", True),
+    ("MD_Commission", "Department", "Location", "Department", "[dbo].[MP/MD COMMISSIONS]", True),
+    ("MP_Commission", "Practice MP Name", "Location", "Practice MP Name", "[dbo].[PRACTICE_MP]", False),
+    ("Practice MD Commission", "Practice_MD_Name", "PracticeMD", "Practice_MD_Name", "[dbo].[PRACTICE_MD]", False),
+    ("MP as PM Commission", "Location", "Location", "MP as PM", "[dbo].[MP as PM COMMISSION]", False),
+    ("3rd Party Payout 1", "Location", "Location", "Location", "[dbo].[3RD_PARTY COMMISSION]", False),
+]
+
+# (person dropdown, detail table) of each part on the page
+COMMISSION_TABLES = [
+    ('mp-dropdown', 'mp-table'),
+    ('md-dropdown', 'md-table'),
+    ('practice-mp-dropdown', 'practice-mp-table'),
+    ('practice-md-dropdown', 'practice-md-table'),
+    ('mp-as-pm-dropdown', 'mp-as-pm-table'),
+    ('third-party-dropdown', 'third-party-table'),
+]
+
+
+def commission_part_sql(part):
+    # The month is a half-open range on [Invoice_Date], so an index on it can
+    # be used, and its bounds are bound parameters, so SQL Server compiles the
+    # statement once and reuses the cached plan. Column and table names only
+    # come from COMMISSION_PARTS. [Person] is the column the person dropdown
+    # filters on, applied locally (see commission_part).
+    kpi, name_column, _, person_column, table, has_account_code = COMMISSION_PARTS[part]
+    return f"""
+        SELECT {part} AS [Part], TRIM([{name_column}]) AS [Name], [Client_Name], [Invoice_Description], [Invoice_Date],
+               [Invoice_Amount], [FullyPaidOnDate], [{kpi}] AS [Commission],
+               {"[AccountCode]" if has_account_code else "NULL"} AS [AccountCode], TRIM([{person_column}]) AS [Person]
+        FROM {table}
+        WHERE [Invoice_Date] >= :start AND [Invoice_Date] < :end"""
+
+
+def commission_part(df, part, person=None):
+    # One table's rows of a month (its partition), with its own column names,
+    # keeping only the selected person's rows where there is one
+    # (case-insensitive, like the SQL Server comparison it replaces)
+    kpi, _, heading, _, _, has_account_code = COMMISSION_PARTS[part]
+    rows = df["Part"] == part
+    if person:
+        rows &= df["Person"].fillna("").str.casefold() == person.strip().casefold()
+    frame = df[rows].drop(columns=["Part", "Person"]).reset_index(drop=True)
+    frame = frame.rename(columns={"Name": heading, "Commission": kpi})
+    if not has_account_code:
+        frame = frame.drop(columns="AccountCode")
+    return frame
+
+
+def month_range(year, month):
+    # [first day of the month, first day of the next month)
+    start = datetime.date(int(year), int(month), 1)
+    end = datetime.date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+# --- Month partitions ---
+# Commissions of closed months do not change, so each table's month is read
+# from SQL once, for everyone, the first time that table is expanded, and
+# kept in memory and as an Arrow file in SNAPSHOT_CACHE_DIR
+# (commissions_YYYY_MM_<part>.arrow); dropdown filters are applied to that
+# partition locally. Closed-month partitions are served indefinitely, so
+# browsing past months never hits the database, even after a restart.
+# The last COMMISSION_OPEN_MONTHS months (the current and previous one by
+# default) can still change and are re-read once they are older than
+# COMMISSION_OPEN_TTL_SECONDS. Delete a file to force a closed month to reload.
+# In memory, partitions are evicted least recently used once they take more
+# than COMMISSION_PARTITION_MAX_BYTES; evicted ones are read back from disk.
+OPEN_MONTHS = int(os.environ.get("COMMISSION_OPEN_MONTHS", 2))
+OPEN_TTL_SECONDS = int(os.environ.get("COMMISSION_OPEN_TTL_SECONDS", 900))
+PARTITION_MAX_BYTES = int(os.environ.get("COMMISSION_PARTITION_MAX_BYTES", 64 * 1024 ** 2))
+
+_partitions = OrderedDict()  # (year, month, part) -> (frame, loaded_at, closed, size)
+_partition_bytes = 0
+_partition_lock = threading.Lock()  # guards _partitions and _load_locks
+_load_locks = {}  # (year, month, part) -> lock held while that partition is read
+
+
+def is_closed(year, month):
+    today = datetime.date.today()
+    return (today.year - year) * 12 + today.month - month >= OPEN_MONTHS
+
+
+def partition_path(year, month, part):
+    return os.path.join(snapshots.CACHE_DIR, f"commissions_{year}_{month:02d}_{part}.arrow")
+
+
+def write_partition(year, month, part, frame, loaded_at, closed):
+    if not snapshots.CACHE_DIR:
+        return
+    path = partition_path(year, month, part)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    meta = {"loaded_at": loaded_at.isoformat(), "closed": closed}
+    try:
+        os.makedirs(snapshots.CACHE_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, b"commissions": json.dumps(meta).encode()})
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"Error writing commission partition {year}-{month:02d} part {part}:", e)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_partition(year, month, part):
+    path = partition_path(year, month, part) if snapshots.CACHE_DIR else None
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        meta = json.loads(table.schema.metadata[b"commissions"])
+        return table.to_pandas(), datetime.datetime.fromisoformat(meta["loaded_at"]), meta["closed"]
+    except Exception as e:
+        print(f"Error reading commission partition {year}-{month:02d} part {part}:", e)
+        return None
+
+
+def store_partition(key, frame, loaded_at, closed):
+    # Called with the lock held
+    global _partition_bytes
+    if key in _partitions:
+        _partition_bytes -= _partitions.pop(key)[3]
+    size = int(frame.memory_usage(index=False, deep=True).sum())
+    _partitions[key] = (frame, loaded_at, closed, size)
+    _partition_bytes += size
+    while _partition_bytes > PARTITION_MAX_BYTES and len(_partitions) > 1:
+        _partition_bytes -= _partitions.popitem(last=False)[1][3]
+
+
+def commission_month(year, month, part):
+    # One table's rows for one month, from memory, disk or SQL
+    year, month = int(year), int(month)
+    key = (year, month, part)
+    closed = is_closed(year, month)
+
+    def fresh(entry):
+        # A partition read while its month was open is re-read once it closes
+        if entry is None:
+            return False
+        loaded_at, was_closed = entry[1], entry[2]
+        return was_closed or (not closed and (datetime.datetime.now() - loaded_at).total_seconds() < OPEN_TTL_SECONDS)
+
+    def cached():
+        # Called with the lock held
+        entry = _partitions.get(key)
+        if not fresh(entry):
+            return None
+        _partitions.move_to_end(key)
+        return entry[0]
+
+    with _partition_lock:
+        frame = cached()
+        if frame is not None:
+            return frame
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    # Disk and SQL reads only hold this partition's lock, so a slow month
+    # does not hold up lookups of any other one
+    with load_lock:
+        with _partition_lock:
+            frame = cached()  # loaded by another request while this one waited
+        if frame is not None:
+            return frame
+        entry = read_partition(year, month, part)
+        if not fresh(entry):
+            start, end = month_range(year, month)
+            loaded_at = datetime.datetime.now()
+            entry = (db.read_frame(commission_part_sql(part), {"start": start, "end": end}), loaded_at, closed)
+            write_partition(year, month, part, *entry)
+        with _partition_lock:
+            store_partition(key, *entry)
+    return entry[0]
+
 
 # --- Callback ---
+# KPI totals per table for one month and filter state (already scoped to the
+# user), summed from the commission ledger's monthly rollups
+def commission_kpis(year, month, persons):
+    ledger = snapshots.commission_ledger()
+    ledger = ledger[(ledger["Year"] == int(year)) & (ledger["Month"] == int(month))]
+    people = ledger["Person"].astype(str).str.casefold()
+    totals = []
+    for part, person in enumerate(persons):
+        rows = ledger["Part"] == part
+        if person:
+            rows &= people == person.strip().casefold()
+        totals.append(ledger.loc[rows, "Commission"].sum())
+    return totals
+
+
+@memo.memoize("commission_ledger")
+def kpi_cards(year, month, mp_loc, md_dept, practice_mp, practice_md, mp_as_pm, third_party_loc, username):
+    selected = [mp_loc, md_dept, practice_mp, practice_md, mp_as_pm, third_party_loc]
+    persons = [username if username != "admin" else dropdown_val for dropdown_val in selected]
+    kpi_values_raw = commission_kpis(year, month, persons)
+    return [format_dollar(val) for val in kpi_values_raw] + [format_dollar(sum(kpi_values_raw))]
+
+
+# Detail rows of one table, read only once the table is expanded. Memoized;
+# the month partitions have no snapshot version, so entries only expire by TTL.
+@memo.memoize()
+def commission_table(part, year, month, person):
+    df = commission_part(commission_month(year, month, part), part, person)
+    if not df.empty:
+        total_row = {col: '' for col in df.columns}
+        for col in df.select_dtypes(include='number'):
+            total_row[col] = df[col].sum()
+        total_row[df.columns[0]] = 'Total'
+        df = pd.concat([df, pd.DataFrame([total_row])], ignore_index=True)
+    return df.to_dict('records')
+
+
 def register_callbacks(app):
     import dash
     from dash import Input, Output
@@ -245,6 +395,8 @@ def register_callbacks(app):
     )
     def update_dropdowns(user_data):
         username = user_data.get("username") if user_data else "admin"
+        location_options, department_options, practice_mp_options, practice_md_options, mp_as_pm_options = \
+            dropdown_options()
 
         if username == "admin":
             return (
@@ -270,14 +422,8 @@ def register_callbacks(app):
                 filtered_location_options
             )
 
-    # === 2. Main Data Update Callback ===
+    # === 2. KPI Cards Callback (from the ledger) ===
     @app.callback(
-        Output('mp-table', 'data'),
-        Output('md-table', 'data'),
-        Output('practice-mp-table', 'data'),
-        Output('practice-md-table', 'data'),
-        Output('mp-as-pm-table', 'data'),
-        Output('third-party-table', 'data'),
         Output('kpi-mp', 'children'),
         Output('kpi-md', 'children'),
         Output('kpi-prac-mp', 'children'),
@@ -295,83 +441,44 @@ def register_callbacks(app):
         Input('third-party-dropdown', 'value'),
         Input('user-store', 'data')
     )
-    def update_all(year, month, mp_loc, md_dept, practice_mp, practice_md, mp_as_pm, third_party_loc, user_data):
+    def update_kpis(year, month, mp_loc, md_dept, practice_mp, practice_md, mp_as_pm, third_party_loc, user_data):
         try:
             if not year or not month:
-                return [[] for _ in range(6)] + ["$0"] * 7
+                return ["$0"] * 7
 
             username = user_data.get("username") if user_data else "admin"
-
-            def apply_filter(field, dropdown_val):
-                if username != "admin":
-                    return f"AND TRIM([{field}]) = '{username}'"
-                return f"AND TRIM([{field}]) = '{dropdown_val}'" if dropdown_val else ""
-
-            queries = [
-                ("MP_Commission", f"""
-                    SELECT TRIM([Location]) AS [Location], [Client_Name], [Invoice_Description], [Invoice_Date], [Invoice_Amount],
-                           [FullyPaidOnDate], [MP_Commission], [AccountCode]
-                    FROM [dbo].[MP/MD COMMISSIONS]
-                    WHERE YEAR([Invoice_Date]) = {year} AND MONTH([Invoice_Date]) = {month}
-                    {apply_filter('Location', mp_loc)}
-                """),
-                ("MD_Commission", f"""
-                    SELECT TRIM([Department]) AS [Location], [Client_Name], [Invoice_Description], [Invoice_Date], [Invoice_Amount],
-                           [FullyPaidOnDate], [MD_Commission], [AccountCode]
-                    FROM [dbo].[MP/MD COMMISSIONS]
-                    WHERE YEAR([Invoice_Date]) = {year} AND MONTH([Invoice_Date]) = {month}
-                    {apply_filter('Department', md_dept)}
-                """),
-                ("MP_Commission", f"""
-                    SELECT TRIM([Practice MP Name]) AS [Location], [Client_Name], [Invoice_Description], [Invoice_Date], [Invoice_Amount],
-                           [FullyPaidOnDate], [MP_Commission]
-                    FROM [dbo].[PRACTICE_MP]
-                    WHERE YEAR([Invoice_Date]) = {year} AND MONTH([Invoice_Date]) = {month}
-                    {apply_filter('Practice MP Name', practice_mp)}
-                """),
-                ("Practice MD Commission", f"""
-                    SELECT TRIM([Practice_MD_Name]) AS [PracticeMD], [Client_Name], [Invoice_Description], [Invoice_Date], [Invoice_Amount],
-                           [FullyPaidOnDate], [Practice MD Commission]
-                    FROM [dbo].[PRACTICE_MD]
-                    WHERE YEAR([Invoice_Date]) = {year} AND MONTH([Invoice_Date]) = {month}
-                    {apply_filter('Practice_MD_Name', practice_md)}
-                """),
-                ("MP as PM Commission", f"""
-                    SELECT TRIM([Location]) AS [Location], [Client_Name], [Invoice_Description], [Invoice_Date], [Invoice_Amount],
-                           [FullyPaidOnDate], [MP as PM Commission]
-                    FROM [dbo].[MP as PM COMMISSION]
-                    WHERE YEAR([Invoice_Date]) = {year} AND MONTH([Invoice_Date]) = {month}
-                    {apply_filter('MP as PM', mp_as_pm)}
-                """),
-                ("3rd Party Payout 1", f"""
-                    SELECT TRIM([Location]) AS [Location], [Client_Name], [Invoice_Description], [Invoice_Date], [Invoice_Amount],
-                           [FullyPaidOnDate], [3rd Party Payout 1]
-                    FROM [dbo].[3RD_PARTY COMMISSION]
-                    WHERE YEAR([Invoice_Date]) = {year} AND MONTH([Invoice_Date]) = {month}
-                    {apply_filter('Location', third_party_loc)}
-                """)
-            ]
-
-            table_data = []
-            kpi_values_raw = []
-
-            for col_name, query in queries:
-                df = pd.read_sql(query, engine)
-                kpi_sum = df[col_name].sum() if not df.empty else 0
-                kpi_values_raw.append(kpi_sum)
-                if not df.empty:
-                    total_row = {col: '' for col in df.columns}
-                    for col in df.select_dtypes(include='number'):
-                        total_row[col] = df[col].sum()
-                    total_row[df.columns[0]] = 'Total'
-                    df = pd.concat([df, pd.DataFrame([total_row])], ignore_index=True)
-                table_data.append(df.to_dict('records'))
-
-            kpi_values = [format_dollar(val) for val in kpi_values_raw]
-            total_kpi = format_dollar(sum(kpi_values_raw))
-
-            return table_data + kpi_values + [total_kpi]
+            return kpi_cards(year, month, mp_loc, md_dept, practice_mp, practice_md, mp_as_pm, third_party_loc, username)
 
         except Exception as e:
             print("Error:", e)
-            return [[] for _ in range(6)] + ["$0"] * 7
+            return ["$0"] * 7
+
+    # === 3. Detail Table Callbacks (one per table, only while expanded) ===
+    for part, (dropdown_id, table_id) in enumerate(COMMISSION_TABLES):
+        @app.callback(
+            Output(f'{table_id}-collapse', 'is_open'),
+            Output(f'{table_id}-toggle', 'children'),
+            Input(f'{table_id}-toggle', 'n_clicks'),
+            prevent_initial_call=True
+        )
+        def toggle_table(n_clicks):
+            is_open = bool(n_clicks and n_clicks % 2)
+            return is_open, "Hide details" if is_open else "Show details"
+
+        @app.callback(
+            Output(table_id, 'data'),
+            Input('year-dropdown', 'value'),
+            Input('month-dropdown', 'value'),
+            Input(dropdown_id, 'value'),
+            Input(f'{table_id}-collapse', 'is_open'),
+            Input('user-store', 'data')
+        )
+        def update_table(year, month, dropdown_val, is_open, user_data, part=part):
+            if not is_open or not year or not month:
+                return []
+            try:
+                username = user_data.get("username") if user_data else "admin"
+                return commission_table(part, year, month, username if username != "admin" else dropdown_val)
+            except Exception as e:
+                print("Error:", e)
+                return []
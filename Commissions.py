@@ -2,81 +2,67 @@ import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html
 import pandas as pd
-from sqlalchemy import create_engine
-import urllib
+import db
 
-# SQL Server connection setup
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-    f"SERVER={server};DATABASE={database};UID={username};PWD={password};"
-)
-
-engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-
-# Load full views
-def load_view(view_name):
+# Load only the columns a view is used for
+def load_view(view_name, columns):
     try:
-        return pd.read_sql(f"SELECT * FROM {view_name}", engine)
+        return db.read_frame(f"SELECT {', '.join(f'[{col}]' for col in columns)} FROM {view_name}")
     except Exception as e:
         print(f"Error loading view {view_name}: {e}")
         return pd.DataFrame()
 
 # KPI functions
-def get_mp_commission(engine):
+def get_mp_commission():
     query = """
         SELECT SUM([MP_Commission]) AS total_commission
         FROM [dbo].[MP/MD COMMISSIONS]
         WHERE [Status] = 'PAID'
     """
-    df = pd.read_sql(query, engine)
+    df = db.read_frame(query)
     return df.iloc[0, 0] if not df.empty and pd.notna(df.iloc[0, 0]) else 0
 
-def get_practice_mp_commission(engine):
+def get_practice_mp_commission():
     query = """
         SELECT SUM([Practice MP Commission]) AS total_commission
         FROM [dbo].[PRACTICE_MP]
         WHERE [Status] = 'PAID'
     """
-    df = pd.read_sql(query, engine)
+    df = db.read_frame(query)
     return df.iloc[0, 0] if not df.empty and pd.notna(df.iloc[0, 0]) else 0
 
-def get_third_party_commission(engine):
+def get_third_party_commission():
     query = """
         SELECT SUM([3rd Party Payout 1]) AS total_commission
         FROM [dbo].[3RD_PARTY COMMISSION]
         WHERE [Status] = 'PAID'
     """
-    df = pd.read_sql(query, engine)
+    df = db.read_frame(query)
     return df.iloc[0, 0] if not df.empty and pd.notna(df.iloc[0, 0]) else 0
 
-def get_mp_as_pm_commission(engine):
+def get_mp_as_pm_commission():
     query = """
         SELECT SUM([MP as PM Commission]) AS total_commission
         FROM [dbo].[MP as PM COMMISSION]
         WHERE [Status] = 'PAID'
     """
-    df = pd.read_sql(query, engine)
+    df = db.read_frame(query)
     return df.iloc[0, 0] if not df.empty and pd.notna(df.iloc[0, 0]) else 0
 
-def get_practice_md_commission(engine):
+def get_practice_md_commission():
     query = """
         SELECT SUM([Practice MD Commission]) AS total_commission
         FROM [dbo].[PRACTICE_MD]
         WHERE [Status] = 'PAID'
     """
-    df = pd.read_sql(query, engine)
+    df = db.read_frame(query)
     return "${:,.0f}".format(df.iloc[0, 0]) if not df.empty and pd.notna(df.iloc[0, 0]) else "$0"
 
-def get_total_commission(engine):
-    mp = get_mp_commission(engine)
-    pmp = get_practice_mp_commission(engine)
-    tp = get_third_party_commission(engine)
-    mp_pm = get_mp_as_pm_commission(engine)
+def get_total_commission():
+    mp = get_mp_commission()
+    pmp = get_practice_mp_commission()
+    tp = get_third_party_commission()
+    mp_pm = get_mp_as_pm_commission()
     total = mp + pmp + tp + mp_pm
     return "${:,.0f}".format(total)
 
@@ -84,7 +70,7 @@ def format_dollar(value):
     return "${:,.0f}".format(value) if pd.notna(value) else "$0"
 
 # Load chart data
-practice_mp_df = load_view("[dbo].[PRACTICE_MP]")
+practice_mp_df = load_view("[dbo].[PRACTICE_MP]", ["Month", "Invoice_Amount"])
 
 # Dash app setup
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
@@ -116,32 +102,32 @@ app.layout = dbc.Container([
 
     dbc.Row([
         dbc.Col(html.Div([
-            html.H4(format_dollar(get_mp_commission(engine)), style={"color": "#80ff00", "fontWeight": "bold"}),
+            html.H4(format_dollar(get_mp_commission()), style={"color": "#80ff00", "fontWeight": "bold"}),
             html.Div("MP Commission", style={"color": "#80ff00", "fontSize": "14px", "fontWeight": "bold"})
         ], style={**card_base_style, "boxShadow": "0 0 10px #80ff00"}), width=2),
 
         dbc.Col(html.Div([
-            html.H4(format_dollar(get_practice_mp_commission(engine)), style={"color": "#ffff33", "fontWeight": "bold"}),
+            html.H4(format_dollar(get_practice_mp_commission()), style={"color": "#ffff33", "fontWeight": "bold"}),
             html.Div("Practice MP Comm", style={"color": "#ffff33", "fontSize": "14px", "fontWeight": "bold"})
         ], style={**card_base_style, "boxShadow": "0 0 10px #ffff33"}), width=2),
 
         dbc.Col(html.Div([
-            html.H4(format_dollar(get_third_party_commission(engine)), style={"color": "#ffcc00", "fontWeight": "bold"}),
+            html.H4(format_dollar(get_third_party_commission()), style={"color": "#ffcc00", "fontWeight": "bold"}),
             html.Div("3rd Party Comm", style={"color": "#ffcc00", "fontSize": "14px", "fontWeight": "bold"})
         ], style={**card_base_style, "boxShadow": "0 0 10px #ffcc00"}), width=2),
 
         dbc.Col(html.Div([
-            html.H4(format_dollar(get_mp_as_pm_commission(engine)), style={"color": "#33d1ff", "fontWeight": "bold"}),
+            html.H4(format_dollar(get_mp_as_pm_commission()), style={"color": "#33d1ff", "fontWeight": "bold"}),
             html.Div("MP as PM Comm", style={"color": "#33d1ff", "fontSize": "14px", "fontWeight": "bold"})
         ], style={**card_base_style, "boxShadow": "0 0 10px #33d1ff"}), width=2),
 
         dbc.Col(html.Div([
-            html.H4(get_practice_md_commission(engine), style={"color": "#00ff80", "fontWeight": "bold"}),
+            html.H4(get_practice_md_commission(), style={"color": "#00ff80", "fontWeight": "bold"}),
             html.Div("Practice MD Comm", style={"color": "#00ff80", "fontSize": "14px", "fontWeight": "bold"})
         ], style={**card_base_style, "boxShadow": "0 0 10px #00ff80"}), width=2),
 
         dbc.Col(html.Div([
-            html.H4(get_total_commission(engine), style={"color": "#ff66cc", "fontWeight": "bold"}),
+            html.H4(get_total_commission(), style={"color": "#ff66cc", "fontWeight": "bold"}),
             html.Div("Total Commission", style={"color": "#ff66cc", "fontSize": "14px", "fontWeight": "bold"})
         ], style={**card_base_style, "boxShadow": "0 0 12px #ff66cc"}), width=2),
     ]),
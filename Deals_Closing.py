@@ -1,48 +1,13 @@
 import pandas as pd
+import snapshots
+import memo
 from dash import dcc, html, Input, Output, State, callback_context
 import dash_table
 import plotly.graph_objects as go
-import urllib
-import sqlalchemy
 import dash
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 
-# SQL Server Connection
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-table_name = 'dbo.DEALS'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-    f"SERVER={server};"
-    f"DATABASE={database};"
-    f"UID={username};"
-    f"PWD={password};"
-)
-engine = sqlalchemy.create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-
-# Normalize Status column for consistent filtering
-df['Status'] = df['Status'].astype(str).str.strip().str.lower()
-
-# Filter dataframe to include only active status
-df = df[df['Status'] == 'active']
-
-# Preprocessing
-df['Created Time'] = pd.to_datetime(df['Created Time'], errors='coerce')
-df['Closing Date'] = pd.to_datetime(df['Closing Date'], errors='coerce')
-df['Stage'] = df['Stage'].fillna('')
-df['Deal Owner Name'] = df['Deal Owner Name'].fillna('Unknown')
-df['# Deals Entered'] = 1
-closed_stages = ['Closed (Lost)', 'Closed (Future prospect)', 'Implementation', 'On-Going Services', 'Engagement Completed']
-df['Is Closed'] = df['Stage'].isin(closed_stages)
-
-deal_owners = sorted(df['Deal Owner Name'].unique())
-service_lines = sorted(df['Service Line'].dropna().unique())
-
 # Dropdown style
 dropdown_style = {
     "width": "320px",
@@ -70,71 +35,88 @@ def kpi_card(title, value):
         }
     )
 
-# ===================== Layout =====================
-deals_closing_layout = html.Div(style={'backgroundColor': '#111', 'padding': '15px'}, children=[
-    html.Div([
-        html.Div([
-            dcc.Dropdown(
-                id='service-filter-deals-closing',
-                options=[{'label': i, 'value': i} for i in service_lines],
-                placeholder="Select Service Line",
-                clearable=True,
-                multi=True,
-                style=dropdown_style
-            ),
-        ], style={'marginRight': '20px'}),
-
-        html.Div([
-            dcc.Dropdown(
-                id='owner-filter-deals-closing',
-                options=[{'label': i, 'value': i} for i in deal_owners],
-                placeholder="Select Deal Owner",
-                clearable=True,
-                multi=True,
-                style=dropdown_style
-            ),
-        ]),
-    ], style={'display': 'flex', 'marginBottom': '20px'}),
+# Deals matching the selected owners / service lines (shared filter engine)
+def filtered_deals(selected_owner, selected_service):
+    return snapshots.select("deals", [
+        ('Deal Owner Name', selected_owner or None),
+        ('Service Line', selected_service or None),
+    ], columns=['Deal Owner Name', 'Deal Name', 'Is Closed'])
 
-    html.Div(id='kpi-cards-deals-closing', style={'display': 'flex', 'marginBottom': '20px', 'gap': '15px'}),
+# ===================== Layout =====================
+def deals_closing_layout():
+    # Shared deals snapshot (snapshots.py), already limited to active deals
+    df = snapshots.deals()
+    deal_owners = sorted(df['Deal Owner Name'].unique())
+    service_lines = sorted(df['Service Line'].dropna().unique())
 
-    html.Div(style={'display': 'flex'}, children=[
+    return html.Div(style={'backgroundColor': '#111', 'padding': '15px'}, children=[
         html.Div([
-            html.Div(id='data-table-deals-closing'),
-            html.Button("Export to CSV", id="export-btn-deals-closing", n_clicks=0,
-                        style={'marginTop': '10px', 'backgroundColor': '#FFD700', 'color': 'black',
-                               'fontWeight': 'bold', 'border': 'none', 'borderRadius': '5px', 'padding': '8px'}),
-            dcc.Download(id="download-deals-closing")
-        ], style={'width': '50%', 'paddingRight': '10px'}),
-        html.Div(id='bar-chart-deals-closing', style={'width': '50%', 'paddingLeft': '10px'}),
+            html.Div([
+                dcc.Dropdown(
+                    id='service-filter-deals-closing',
+                    options=[{'label': i, 'value': i} for i in service_lines],
+                    placeholder="Select Service Line",
+                    clearable=True,
+                    multi=True,
+                    style=dropdown_style
+                ),
+            ], style={'marginRight': '20px'}),
+
+            html.Div([
+                dcc.Dropdown(
+                    id='owner-filter-deals-closing',
+                    options=[{'label': i, 'value': i} for i in deal_owners],
+                    placeholder="Select Deal Owner",
+                    clearable=True,
+                    multi=True,
+                    style=dropdown_style
+                ),
+            ]),
+        ], style={'display': 'flex', 'marginBottom': '20px'}),
+
+        html.Div(id='kpi-cards-deals-closing', style={'display': 'flex', 'marginBottom': '20px', 'gap': '15px'}),
+
+        html.Div(style={'display': 'flex'}, children=[
+            html.Div([
+                html.Div(id='data-table-deals-closing'),
+                html.Button("Export to CSV", id="export-btn-deals-closing", n_clicks=0,
+                            style={'marginTop': '10px', 'backgroundColor': '#FFD700', 'color': 'black',
+                                   'fontWeight': 'bold', 'border': 'none', 'borderRadius': '5px', 'padding': '8px'}),
+                dcc.Download(id="download-deals-closing")
+            ], style={'width': '50%', 'paddingRight': '10px'}),
+            html.Div(id='bar-chart-deals-closing', style={'width': '50%', 'paddingLeft': '10px'}),
+        ])
     ])
-])
 
 # ===================== Callbacks =====================
 def register_deals_closing_callbacks(app):
     @app.callback(
-        [Output('kpi-cards-deals-closing', 'children'),
+        [Output('owner-filter-deals-closing', 'options'),
+         Output('service-filter-deals-closing', 'options'),
+         Output('kpi-cards-deals-closing', 'children'),
          Output('data-table-deals-closing', 'children'),
          Output('bar-chart-deals-closing', 'children')],
         [Input('owner-filter-deals-closing', 'value'),
          Input('service-filter-deals-closing', 'value')],
     )
+    @memo.memoize("deals")
     def update_dashboard(selected_owner, selected_service):
-        filtered_df = df.copy()
+        filtered_df = filtered_deals(selected_owner, selected_service)
 
-        # Filter by selected owner if any
-        if selected_owner:
-            filtered_df = filtered_df[filtered_df['Deal Owner Name'].isin(selected_owner)]
-        # Filter by selected service if any
-        if selected_service:
-            filtered_df = filtered_df[filtered_df['Service Line'].isin(selected_service)]
+        # Owner / Service Line options with deal counts under the other filter
+        counts = snapshots.facets("deals", [
+            ('Deal Owner Name', selected_owner or None),
+            ('Service Line', selected_service or None),
+        ], ['Deal Owner Name', 'Service Line'])
+        owner_options = snapshots.facet_options(counts['Deal Owner Name'], selected_owner)
+        service_options = snapshots.facet_options(counts['Service Line'], selected_service)
 
-        entered_group = filtered_df.groupby('Deal Owner Name').agg({
+        entered_group = filtered_df.groupby('Deal Owner Name', observed=True).agg({
             'Deal Name': pd.Series.nunique
         }).reset_index().rename(columns={'Deal Name': '# Deals Entered'})
 
         closed_df = filtered_df[filtered_df['Is Closed']]
-        closed_group = closed_df.groupby('Deal Owner Name').agg({
+        closed_group = closed_df.groupby('Deal Owner Name', observed=True).agg({
             'Deal Name': pd.Series.nunique
         }).reset_index().rename(columns={'Deal Name': '# Deals Closed'})
 
@@ -227,7 +209,7 @@ def register_deals_closing_callbacks(app):
             margin=dict(t=80, l=40, r=10, b=80)
         )
 
-        return kpi_cards, table, dcc.Graph(figure=bar_fig)
+        return owner_options, service_options, kpi_cards, table, dcc.Graph(figure=bar_fig)
 
     @app.callback(
         Output("download-deals-closing", "data"),
@@ -239,18 +221,14 @@ def register_deals_closing_callbacks(app):
     def export_csv(n_clicks, selected_owner, selected_service):
         if n_clicks is None or n_clicks == 0:
             raise PreventUpdate
-        filtered_df = df.copy()
-        if selected_owner:
-            filtered_df = filtered_df[filtered_df['Deal Owner Name'].isin(selected_owner)]
-        if selected_service:
-            filtered_df = filtered_df[filtered_df['Service Line'].isin(selected_service)]
+        filtered_df = filtered_deals(selected_owner, selected_service)
 
-        entered_group = filtered_df.groupby('Deal Owner Name').agg({
+        entered_group = filtered_df.groupby('Deal Owner Name', observed=True).agg({
             'Deal Name': pd.Series.nunique
         }).reset_index().rename(columns={'Deal Name': '# Deals Entered'})
 
         closed_df = filtered_df[filtered_df['Is Closed']]
-        closed_group = closed_df.groupby('Deal Owner Name').agg({
+        closed_group = closed_df.groupby('Deal Owner Name', observed=True).agg({
             'Deal Name': pd.Series.nunique
         }).reset_index().rename(columns={'Deal Name': '# Deals Closed'})
 
@@ -271,11 +249,3 @@ def register_deals_closing_callbacks(app):
         grouped['% Deals Closed'] = grouped['% Deals Closed'].astype(str) + '%'
 
         return dcc.send_data_frame(grouped.to_csv, "Deals_Closing_Export.csv", index=False)
-
-
-# ===================== Dash App Setup =====================
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
-app.layout = deals_closing_layout
-register_deals_closing_callbacks(app)
-
-
@@ -1,34 +1,31 @@
 import pandas as pd
+import snapshots
+import memo
 import plotly.express as px
 from dash import dcc, html, Input, Output
-from sqlalchemy import create_engine
-import urllib
 import datetime
 import dash_bootstrap_components as dbc
 
-# ✅ Fetch data from SQL Server
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-table_name = 'dbo.DEALS'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-    f"SERVER={server};DATABASE={database};UID={username};PWD={password};"
-)
-
-engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-
-# ✅ Clean and preprocess data
-df["Amount"] = df["Amount"].replace({r'\$': '', ',': ''}, regex=True).astype(float)
-df["Closing Date"] = pd.to_datetime(df["Closing Date"], errors='coerce')
-df["Closing Month"] = df["Closing Date"].dt.strftime("%b-%Y")
-
 # ✅ Time References
-current_month = pd.Timestamp.now().strftime("%b-%Y")
-next_month = (pd.Timestamp.now() + pd.DateOffset(months=1)).strftime("%b-%Y")
+current_month = pd.Timestamp.now().strftime("%Y-%m")
+next_month = (pd.Timestamp.now() + pd.DateOffset(months=1)).strftime("%Y-%m")
+
+# Closing month dropdown ("this_month" / "next_month" / "other") as a
+# snapshots.select() predicate; None when nothing is selected
+def closing_month_filter(closing_month):
+    if not closing_month or not {"this_month", "next_month", "other"} & set(closing_month):
+        return None
+
+    def matches(months):
+        mask = pd.Series(False, index=months.index)
+        if "this_month" in closing_month:
+            mask |= months == current_month
+        if "next_month" in closing_month:
+            mask |= months == next_month
+        if "other" in closing_month:
+            mask |= ~months.isin([current_month, next_month])
+        return mask
+    return matches
 
 # ✅ Franchise Valid Stages
 valid_stages = [
@@ -36,9 +33,6 @@ valid_stages = [
     "Application Form & Background Verification"
 ]
 
-# ✅ Filter only active employees once
-active_df = df[df["Status"].str.lower() == "active"]
-
 # ✅ Dropdown style
 dropdown_style = {
     "width": "320px",
@@ -70,76 +64,81 @@ def kpi_card(title, value):
     )
 
 # ✅ Layout
-franchise_layout = html.Div(style={"backgroundColor": "black", "color": "white", "padding": "10px"}, children=[
-
-    html.Div([
-        dcc.Dropdown(id="franchise_deal_owner",
-                     multi=True,
-                     options=[{"label": i, "value": i} for i in sorted(active_df["Deal Owner Name"].dropna().unique())],
-                     placeholder="Deal Owner Name",
-                     style=dropdown_style),
-
-        dcc.Dropdown(id="franchise_closing_month",
-                     multi=True,
-                     options=[
-                         {"label": "This Month", "value": "this_month"},
-                         {"label": "Next Month", "value": "next_month"},
-                         {"label": "Other", "value": "other"}
-                     ],
-                     placeholder="Closing Month",
-                     style=dropdown_style),
-
-        dcc.Dropdown(id="franchise_region",
-                     multi=True,
-                     options=[{"label": "All", "value": "All"}] + (
-                         [{"label": i, "value": i} for i in sorted(active_df["Region"].dropna().unique())]
-                         if "Region" in active_df.columns else []
-                     ),
-                     placeholder="Region",
-                     style=dropdown_style)
-    ], style={"display": "flex", "gap": "10px", "padding": "10px", "marginLeft": "30px"}),
-
-    html.Div(id="franchise_kpi_cards", style={"display": "flex", "justifyContent": "center", "gap": "20px", "padding": "20px"}),
-
-    html.Div(id="franchise_stage_table_div", style={"padding": "10px"}),
-
-    dcc.Graph(id="franchise_bar_chart")
-])
+def franchise_layout():
+    # ✅ Shared deals snapshot (snapshots.py), already limited to active deals
+    active_df = snapshots.deals()
+
+    return html.Div(style={"backgroundColor": "black", "color": "white", "padding": "10px"}, children=[
+
+        html.Div([
+            dcc.Dropdown(id="franchise_deal_owner",
+                         multi=True,
+                         options=[{"label": i, "value": i} for i in sorted(active_df["Deal Owner Name"].dropna().unique())],
+                         placeholder="Deal Owner Name",
+                         style=dropdown_style),
+
+            dcc.Dropdown(id="franchise_closing_month",
+                         multi=True,
+                         options=[
+                             {"label": "This Month", "value": "this_month"},
+                             {"label": "Next Month", "value": "next_month"},
+                             {"label": "Other", "value": "other"}
+                         ],
+                         placeholder="Closing Month",
+                         style=dropdown_style),
+
+            dcc.Dropdown(id="franchise_region",
+                         multi=True,
+                         options=[{"label": "All", "value": "All"}] + (
+                             [{"label": i, "value": i} for i in sorted(active_df["Region"].dropna().unique())]
+                             if "Region" in active_df.columns else []
+                         ),
+                         placeholder="Region",
+                         style=dropdown_style)
+        ], style={"display": "flex", "gap": "10px", "padding": "10px", "marginLeft": "30px"}),
+
+        html.Div(id="franchise_kpi_cards", style={"display": "flex", "justifyContent": "center", "gap": "20px", "padding": "20px"}),
+
+        html.Div(id="franchise_stage_table_div", style={"padding": "10px"}),
+
+        dcc.Graph(id="franchise_bar_chart")
+    ])
 
 # ✅ Callbacks
 def register_franchise_callbacks(app):
     @app.callback(
-        [Output("franchise_kpi_cards", "children"),
+        [Output("franchise_deal_owner", "options"),
+         Output("franchise_region", "options"),
+         Output("franchise_kpi_cards", "children"),
          Output("franchise_stage_table_div", "children"),
          Output("franchise_bar_chart", "figure")],
         [Input("franchise_deal_owner", "value"),
          Input("franchise_closing_month", "value"),
          Input("franchise_region", "value")]
     )
+    @memo.memoize("deals")
     def update_franchise(deal_owner, closing_month, region):
-        filtered_df = active_df[active_df["Stage"].isin(valid_stages)]
-
-        if deal_owner:
-            filtered_df = filtered_df[filtered_df["Deal Owner Name"].isin(deal_owner)]
-
-        if closing_month:
-            month_filters = []
-            if "this_month" in closing_month:
-                month_filters.append(filtered_df["Closing Month"] == current_month)
-            if "next_month" in closing_month:
-                month_filters.append(filtered_df["Closing Month"] == next_month)
-            if "other" in closing_month:
-                month_filters.append(~filtered_df["Closing Month"].isin([current_month, next_month]))
-            if month_filters:
-                filtered_df = filtered_df[pd.concat(month_filters, axis=1).any(axis=1)]
-
-        if region:
-            if "All" not in region and "Region" in active_df.columns:
-                filtered_df = filtered_df[filtered_df["Region"].isin(region)]
+        has_region = "Region" in snapshots.deals().columns
+        # Deals cube cells (counts and sums per owner, stage, region, ...)
+        filters = [
+            ("Deal Owner Name", deal_owner or None),
+            ("Closing Month", closing_month_filter(closing_month)),
+            ("Region", region if region and "All" not in region and has_region else None),
+        ]
+        filtered_df = snapshots.cube_select("deals", [("Stage", valid_stages)] + filters)
+
+        # ✅ Owner / Region options with deal counts under the other filters
+        facet_columns = ["Deal Owner Name", "Region"] if has_region else ["Deal Owner Name"]
+        counts = snapshots.facets("deals", filters, facet_columns, scope=[("Stage", valid_stages)])
+        owner_options = snapshots.facet_options(counts["Deal Owner Name"], deal_owner)
+        region_options = [{"label": "All", "value": "All"}] + (
+            snapshots.facet_options(counts["Region"], [r for r in region or [] if r != "All"])
+            if has_region else []
+        )
 
         # ✅ KPI Cards
         ongoing_revenue = filtered_df["Amount"].sum() if not filtered_df.empty else 0
-        deals_closing = filtered_df.shape[0]
+        deals_closing = filtered_df["Rows"].sum()
 
         kpi_cards = [
             kpi_card("Ongoing Revenue", f"${ongoing_revenue:,.2f}"),
@@ -148,7 +147,7 @@ def register_franchise_callbacks(app):
 
         # ✅ Table
         if not filtered_df.empty:
-            stage_summary = filtered_df.groupby("Stage").size().reset_index(name="Deals_In_Pipeline")
+            stage_summary = filtered_df.groupby("Stage", observed=True)["Rows"].sum().reset_index(name="Deals_In_Pipeline")
             stage_summary["%GT Deals_In_Pipeline"] = (
                 (stage_summary["Deals_In_Pipeline"] / stage_summary["Deals_In_Pipeline"].sum()) * 100
             ).map("{:.2f}%".format)
@@ -186,10 +185,10 @@ def register_franchise_callbacks(app):
 
         # ✅ Bar Chart
         if not filtered_df.empty:
-            df_grouped = filtered_df.groupby(["Deal Owner Name", "Stage"]).size().reset_index(name="Deals_In_Pipeline")
+            df_grouped = filtered_df.groupby(["Deal Owner Name", "Stage"], observed=True)["Rows"].sum().reset_index(name="Deals_In_Pipeline")
             df_grouped["Label"] = df_grouped["Deals_In_Pipeline"].astype(str)
 
-            total_deals_per_owner = df_grouped.groupby("Deal Owner Name")["Deals_In_Pipeline"].sum().reset_index()
+            total_deals_per_owner = df_grouped.groupby("Deal Owner Name", observed=True)["Deals_In_Pipeline"].sum().reset_index()
             sorted_owners = total_deals_per_owner.sort_values(by="Deals_In_Pipeline", ascending=False)["Deal Owner Name"]
 
             bar_chart = px.bar(
@@ -221,4 +220,4 @@ def register_franchise_callbacks(app):
                 font=dict(color="white", size=14)
             )
 
-        return kpi_cards, table, bar_chart
+        return owner_options, region_options, kpi_cards, table, bar_chart
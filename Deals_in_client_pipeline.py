@@ -1,43 +1,34 @@
 import dash
 from dash import dcc, html, Input, Output
 import pandas as pd
+import snapshots
+import memo
 import plotly.express as px
-import urllib
-import sqlalchemy
 import warnings
 import dash_bootstrap_components as dbc
 
 warnings.simplefilter("ignore")
 
-# SQL Server Connection
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-table_name = 'dbo.DEALS'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-    f"SERVER={server};"
-    f"DATABASE={database};"
-    f"UID={username};"
-    f"PWD={password};"
-)
-
-engine = sqlalchemy.create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-
-# Clean numeric columns
-for col in ["Amount", "Consulting Fee"]:
-    if col in df.columns and not df[col].isnull().all():
-        df[col] = df[col].astype(str).replace({r'[$,]': ''}, regex=True)
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-df["Closing Date"] = pd.to_datetime(df["Closing Date"], errors='coerce')
-df["Closing Month"] = df["Closing Date"].dt.strftime("%b-%Y")
-
-current_month = pd.Timestamp.now().strftime("%b-%Y")
-next_month = (pd.Timestamp.now() + pd.DateOffset(months=1)).strftime("%b-%Y")
+# Shared deals snapshot (snapshots.py), already limited to active deals
+current_month = pd.Timestamp.now().strftime("%Y-%m")
+next_month = (pd.Timestamp.now() + pd.DateOffset(months=1)).strftime("%Y-%m")
+
+# Closing month dropdown ("this_month" / "next_month" / "other") as a
+# snapshots.select() predicate; None when nothing is selected
+def closing_month_filter(closing_month):
+    if not closing_month or not {"this_month", "next_month", "other"} & set(closing_month):
+        return None
+
+    def matches(months):
+        mask = pd.Series(False, index=months.index)
+        if "this_month" in closing_month:
+            mask |= months == current_month
+        if "next_month" in closing_month:
+            mask |= months == next_month
+        if "other" in closing_month:
+            mask |= ~months.isin([current_month, next_month])
+        return mask
+    return matches
 
 # Dropdown Style
 dropdown_style = {
@@ -69,41 +60,42 @@ def kpi_card_white(title, value):
         }
     )
 
-# Layout
-client_layout = html.Div(style={"backgroundColor": "black", "color": "white", "padding": "20px"}, children=[
-    html.Div([
-        dcc.Dropdown(
-            id="deal_owner",
-            multi=True,
-            placeholder="Select Deal Owner",
-            style=dropdown_style
-        ),
-        dcc.Dropdown(
-            id="closing_month",
-            multi=True,
-            options=[
-                {"label": "This Month", "value": "this_month"},
-                {"label": "Next Month", "value": "next_month"},
-                {"label": "Other", "value": "other"}
-            ],
-            placeholder="Select Closing Month",
-            style=dropdown_style
-        )
-    ], style={
-        "display": "flex",
-        "gap": "15px",
-        "padding": "10px",
-        "borderRadius": "8px",
-        "justifyContent": "center",
-        "marginBottom": "25px"
-    }),
+# Layout (built on demand, like the other pages)
+def client_layout():
+    return html.Div(style={"backgroundColor": "black", "color": "white", "padding": "20px"}, children=[
+        html.Div([
+            dcc.Dropdown(
+                id="deal_owner",
+                multi=True,
+                placeholder="Select Deal Owner",
+                style=dropdown_style
+            ),
+            dcc.Dropdown(
+                id="closing_month",
+                multi=True,
+                options=[
+                    {"label": "This Month", "value": "this_month"},
+                    {"label": "Next Month", "value": "next_month"},
+                    {"label": "Other", "value": "other"}
+                ],
+                placeholder="Select Closing Month",
+                style=dropdown_style
+            )
+        ], style={
+            "display": "flex",
+            "gap": "15px",
+            "padding": "10px",
+            "borderRadius": "8px",
+            "justifyContent": "center",
+            "marginBottom": "25px"
+        }),
 
-    html.Div(id="kpi_cards", style={"display": "flex", "justifyContent": "center", "gap": "20px", "marginBottom": "30px"}),
+        html.Div(id="kpi_cards", style={"display": "flex", "justifyContent": "center", "gap": "20px", "marginBottom": "30px"}),
 
-    html.Div(id="custom_stage_table", style={"padding": "10px"}),
+        html.Div(id="custom_stage_table", style={"padding": "10px"}),
 
-    dcc.Graph(id="bar_chart", config={"displayModeBar": False})
-])
+        dcc.Graph(id="bar_chart", config={"displayModeBar": False})
+    ])
 
 # Callback
 def register_client_callbacks(app):
@@ -115,38 +107,31 @@ def register_client_callbacks(app):
         [Input("deal_owner", "value"),
          Input("closing_month", "value")]
     )
+    @memo.memoize("deals")
     def update_dashboard(deal_owner, closing_month):
         # ✅ Only consider ACTIVE employees
-        active_df = df[df["Status"].str.lower() == "active"]
-
-        # Filter by allowed stages
-        filtered_df = active_df[active_df["Stage"].isin([
+        # Deals cube cells (counts and sums per owner, stage, ... and closing
+        # month) for the allowed stages, owner and closing month
+        stages = [("Stage", [
             "Agreement Signed", "Awareness", "Closed (Future prospect)", "Closed (Lost)", "Did Not Proceed",
             "Discovery", "Engagement Completed", "Implementation", "Issue Agreement", "Needs Identified",
             "Ongoing Services", "Prospect"
         ])]
+        filters = [
+            ("Deal Owner Name", deal_owner or None),
+            ("Closing Month", closing_month_filter(closing_month)),
+        ]
+        filtered_df = snapshots.cube_select("deals", stages + filters)
 
-        if deal_owner:
-            filtered_df = filtered_df[filtered_df["Deal Owner Name"].isin(deal_owner)]
-
-        if closing_month:
-            filters = []
-            if "this_month" in closing_month:
-                filters.append(filtered_df["Closing Month"] == current_month)
-            if "next_month" in closing_month:
-                filters.append(filtered_df["Closing Month"] == next_month)
-            if "other" in closing_month:
-                filters.append(~filtered_df["Closing Month"].isin([current_month, next_month]))
-            if filters:
-                filtered_df = filtered_df[pd.concat(filters, axis=1).any(axis=1)]
-
-        # ✅ Dropdown options from ACTIVE employees only
-        deal_owner_options = [{"label": owner, "value": owner} for owner in sorted(active_df["Deal Owner Name"].dropna().unique())]
+        # ✅ Dropdown options from ACTIVE employees only, with their deal
+        # counts for the selected closing month
+        counts = snapshots.facets("deals", filters, ["Deal Owner Name"], scope=stages)
+        deal_owner_options = snapshots.facet_options(counts["Deal Owner Name"], deal_owner)
 
         # KPI Cards
         ongoing_revenue = filtered_df["Amount"].sum()
         onetime_revenue = filtered_df["Consulting Fee"].sum()
-        deals_closing = filtered_df.shape[0]
+        deals_closing = filtered_df["Rows"].sum()
 
         kpi_cards = [
             kpi_card_white("Ongoing Revenue", f"${ongoing_revenue:,.2f}"),
@@ -155,7 +140,7 @@ def register_client_callbacks(app):
         ]
 
         # Stage Summary Table
-        stage_summary = filtered_df.groupby("Stage").size().reset_index(name="Deals_In_Pipeline")
+        stage_summary = filtered_df.groupby("Stage", observed=True)["Rows"].sum().reset_index(name="Deals_In_Pipeline")
         stage_summary["%GT Deals_In_Pipeline"] = (
             (stage_summary["Deals_In_Pipeline"] / stage_summary["Deals_In_Pipeline"].sum()) * 100
         ).round(2).astype(str) + "%"
@@ -196,10 +181,10 @@ def register_client_callbacks(app):
         )
 
         # Bar Chart
-        df_grouped = filtered_df.groupby(["Deal Owner Name", "Stage"]).size().reset_index(name="Deals_In_Pipeline")
+        df_grouped = filtered_df.groupby(["Deal Owner Name", "Stage"], observed=True)["Rows"].sum().reset_index(name="Deals_In_Pipeline")
         df_grouped["Label"] = df_grouped["Deals_In_Pipeline"].astype(str)
 
-        total_deals_per_owner = df_grouped.groupby("Deal Owner Name")["Deals_In_Pipeline"].sum().reset_index()
+        total_deals_per_owner = df_grouped.groupby("Deal Owner Name", observed=True)["Deals_In_Pipeline"].sum().reset_index()
         sorted_owners = total_deals_per_owner.sort_values(by="Deals_In_Pipeline", ascending=False)["Deal Owner Name"]
 
         bar_chart = px.bar(
@@ -1,36 +1,19 @@
 import pandas as pd
-import urllib
-import sqlalchemy
+import snapshots
+import memo
 from dash import html, dcc, Input, Output
 import dash_bootstrap_components as dbc
 import plotly.graph_objs as go
 
-# Database configuration
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-table_name = 'dbo.INVOICES'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};DATABASE={database};UID={username};PWD={password};"
-)
-engine = sqlalchemy.create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-
-# Preprocessing
-df['Invoice_Date'] = pd.to_datetime(df['Invoice_Date'])
-df['Year'] = df['Invoice_Date'].dt.year
-df = df[df['Year'] >= 2014]  # ✅ Only include years from 2014
-df['Quarter'] = "Q" + df['Invoice_Date'].dt.quarter.astype(str)
-df['Month'] = df['Invoice_Date'].dt.month_name()
-
-years = sorted(df['Year'].dropna().unique())
-years = [str(int(year)) for year in years]
+# Values of an invoice column, ✅ only on invoices from 2014 onwards, read
+# from the snapshot's bitmap index rather than a copy of its rows
+def invoice_values(column):
+    years = [y for y in snapshots.index_values("invoices", "Year") if y >= 2014]
+    return snapshots.index_values("invoices", column, scope=[("Year", years)])
+
 quarters = ['Q1', 'Q2', 'Q3', 'Q4']
 month_order = ['January', 'February', 'March', 'April', 'May', 'June',
                'July', 'August', 'September', 'October', 'November', 'December']
-months = sorted(df['Month'].dropna().unique(), key=lambda x: month_order.index(x))
 
 # Quarter to months mapping
 quarter_to_months = {
@@ -59,81 +42,95 @@ def styled_card(value, title, color):
     )
 
 # Layout
-layout = html.Div([  
-    dbc.Container([
-        html.Div([], className="mb-3 text-center"),
-
-        dbc.Row([
-            dbc.Col(dcc.Dropdown(
-                options=[{"label": str(y), "value": str(y)} for y in years],
-                value=None,
-                id="year-dropdown",
-                placeholder="Select Year",
-                style={"color": "black"},
-                multi=True
-            ), width=3),
-            dbc.Col(dcc.Dropdown(
-                options=[{"label": q, "value": q} for q in quarters],
-                value=None,
-                id="quarter-dropdown",
-                placeholder="Select Quarter",
-                style={"color": "black"},
-                multi=True
-            ), width=3),
-            dbc.Col(dcc.Dropdown(
-                options=[{"label": m, "value": m} for m in months],
-                value=None,
-                id="month-dropdown",
-                placeholder="Select Month",
-                style={"color": "black"},
-                multi=True
-            ), width=3),
-        ], className="mb-4 justify-content-center"),
-
-        dbc.Row([
-            dbc.Col(html.Div(id="invoice-amount-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
-            dbc.Col(html.Div(id="paid-amount-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
-            dbc.Col(html.Div(id="paid-percent-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
-            dbc.Col(html.Div(id="receivables-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
-            dbc.Col(html.Div(id="receivables-percent-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
-        ], className="gx-3 gy-3 mb-5 justify-content-center"), 
-
-        dbc.Row([
-            dbc.Col(dcc.Graph(id="entity-table", style={"height": "600px"}, config={"modeBarButtonsToRemove": ["toImage"]}), width=6),
-            dbc.Col(dcc.Graph(id="invoice-receivable-chart"), width=6)
-        ])
-    ], fluid=True)
-], style={"backgroundColor": "#000000", "color": "white", "minHeight": "100vh", "padding": "20px"})
+# Built on demand so the snapshot is only read once it is loaded
+def layout():
+    years = [str(int(year)) for year in invoice_values("Year")]
+    months = sorted(invoice_values("Month"), key=lambda x: month_order.index(x))
+
+    return html.Div([  
+        dbc.Container([
+            html.Div([], className="mb-3 text-center"),
+
+            dbc.Row([
+                dbc.Col(dcc.Dropdown(
+                    options=[{"label": str(y), "value": str(y)} for y in years],
+                    value=None,
+                    id="year-dropdown",
+                    placeholder="Select Year",
+                    style={"color": "black"},
+                    multi=True
+                ), width=3),
+                dbc.Col(dcc.Dropdown(
+                    options=[{"label": q, "value": q} for q in quarters],
+                    value=None,
+                    id="quarter-dropdown",
+                    placeholder="Select Quarter",
+                    style={"color": "black"},
+                    multi=True
+                ), width=3),
+                dbc.Col(dcc.Dropdown(
+                    options=[{"label": m, "value": m} for m in months],
+                    value=None,
+                    id="month-dropdown",
+                    placeholder="Select Month",
+                    style={"color": "black"},
+                    multi=True
+                ), width=3),
+            ], className="mb-4 justify-content-center"),
+
+            dbc.Row([
+                dbc.Col(html.Div(id="invoice-amount-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
+                dbc.Col(html.Div(id="paid-amount-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
+                dbc.Col(html.Div(id="paid-percent-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
+                dbc.Col(html.Div(id="receivables-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
+                dbc.Col(html.Div(id="receivables-percent-card", style={"marginRight": "10px"}), xs=6, sm=4, md=2),
+            ], className="gx-3 gy-3 mb-5 justify-content-center"), 
+
+            dbc.Row([
+                dbc.Col(dcc.Graph(id="entity-table", style={"height": "600px"}, config={"modeBarButtonsToRemove": ["toImage"]}), width=6),
+                dbc.Col(dcc.Graph(id="invoice-receivable-chart"), width=6)
+            ])
+        ], fluid=True)
+    ], style={"backgroundColor": "#000000", "color": "white", "minHeight": "100vh", "padding": "20px"})
 
 # Update Dashboard
+@memo.memoize("invoices")
 def update_dashboard(year, quarter, month, user_data):
     username = user_data.get("username") if user_data else None
-    dff = df.copy()
-
-    if username != 'admin' and username is not None:
-        dff = dff[dff["Location"] == username]
-
-    if year:
-        dff = dff[dff['Year'].isin([int(y) for y in year])]
-    
-    if quarter:
-        if isinstance(quarter, str):
-            quarter = [quarter]
-        months_from_quarters = sum([quarter_to_months[q] for q in quarter if q in quarter_to_months], [])
-        dff = dff[dff['Month'].isin(months_from_quarters)]
-
-    if month:
-        dff = dff[dff['Month'].isin(month)]
+    if isinstance(quarter, str):
+        quarter = [quarter]
+
+    # Answered from the invoice cube (Location x Entity x Year x Month sums);
+    # Quarter is derived from the same date as Month
+    scope = [("Location", [username] if username != 'admin' and username is not None else None)]
+    years = [int(y) for y in year] if year else snapshots.index_values("invoices", "Year")
+    quarter = [q for q in quarter if q in quarter_to_months] if quarter else None
+    dff = snapshots.cube_select("invoices", scope + [
+        ("Year", [y for y in years if y >= 2014]),
+        ("Quarter", quarter),
+        ("Month", month or None),
+    ])
+
+    # Dropdown options with row counts, each narrowed by the other dropdowns
+    counts = snapshots.facets("invoices", [
+        ("Year", [int(y) for y in year] if year else None),
+        ("Quarter", quarter),
+        ("Month", month or None),
+    ], ['Year', 'Quarter', 'Month'], scope=scope + [
+        ("Year", [y for y in snapshots.index_values("invoices", "Year") if y >= 2014]),
+    ])
+    year_options = snapshots.facet_options({str(y): n for y, n in counts['Year'].items()}, year)
+    quarter_options = snapshots.facet_options(counts['Quarter'], quarter, order=quarters)
+    month_options = snapshots.facet_options(counts['Month'], month, order=month_order)
 
     total_invoice = dff['Invoice_Amount_USD'].sum()
-    paid_amount = dff['Invoice_Amount_USD'] - dff['Quantity']
-    total_paid = paid_amount.sum()
+    total_paid = dff['Paid_Amount'].sum()
     receivables = total_invoice - total_paid
 
     paid_pct = round((total_paid / total_invoice) * 100, 2) if total_invoice else 0
     recv_pct = round((receivables / total_invoice) * 100, 2) if total_invoice else 0
 
-    by_entity = dff.groupby('Invoice_Entity').agg({
+    by_entity = dff.groupby('Invoice_Entity', observed=True).agg({
         'Invoice_Amount_USD': 'sum',
         'Quantity': 'sum'
     }).reset_index()
@@ -205,7 +202,10 @@ def update_dashboard(year, quarter, month, user_data):
         styled_card(f"${receivables:,.0f}", "Receivables", "red"),
         styled_card(f"{recv_pct}%", "Receivables %", "red"),
         by_entity_fig,
-        chart
+        chart,
+        year_options,
+        quarter_options,
+        month_options
     )
 
 # Callback Registration
@@ -217,7 +217,10 @@ def register_callbacks(app):
          Output("receivables-card", "children"),
          Output("receivables-percent-card", "children"),
          Output("entity-table", "figure"),
-         Output("invoice-receivable-chart", "figure")],
+         Output("invoice-receivable-chart", "figure"),
+         Output("year-dropdown", "options"),
+         Output("quarter-dropdown", "options"),
+         Output("month-dropdown", "options")],
         [Input("year-dropdown", "value"),
          Input("quarter-dropdown", "value"),
          Input("month-dropdown", "value"),
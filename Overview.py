@@ -1,42 +1,52 @@
 import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output, State, Dash, dash_table
 import pandas as pd
+import snapshots
+import memo
 import plotly.express as px
 import plotly.graph_objects as go
-import sqlalchemy
-import urllib
-
-# SQL setup
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-table_name = 'dbo.INVOICES'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};DATABASE={database};UID={username};PWD={password};"
-)
-engine = sqlalchemy.create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-
-# Preprocessing
-df['Invoice_Date'] = pd.to_datetime(df['Invoice_Date'], errors='coerce')
-df = df[df['Invoice_Date'].notna()]  # remove rows with invalid dates
-
-df['Year'] = df['Invoice_Date'].dt.year
-df['Month'] = df['Invoice_Date'].dt.month_name()
-df['AccountCode'] = df['AccountCode'].fillna("Unknown")
-df['Location'] = df['Location'].fillna("Unknown")
-
-# Convert year to string and filter years >= 2020
-df = df[df['Year'] >= 2014]
-df['Year'] = df['Year'].astype(str)
+
+# Values of an invoice column on invoices from 2014 onwards, read from the
+# snapshot's bitmap index rather than a copy of its rows
+def invoice_values(column):
+    years = [y for y in snapshots.index_values("invoices", "Year") if y >= 2014]
+    return snapshots.index_values("invoices", column, scope=[("Year", years)])
+
+# Invoice cube cells (Location x Entity x Year x Month sums) matching the
+# dropdowns; every figure on this page is a sum over them
+def filtered_invoices(username, year, month, entity, mpcode):
+    years = [int(y) for y in year] if year else snapshots.index_values("invoices", "Year")
+    return snapshots.cube_select("invoices", [
+        ("Location", [username] if username != "admin" else None),
+        ("Year", [y for y in years if y >= 2014]),
+        ("Month", month or None),
+        ("Invoice_Entity", entity or None),
+        ("Location", mpcode or None),
+    ])
 
 month_order = [
     "January", "February", "March", "April", "May", "June",
     "July", "August", "September", "October", "November", "December"
 ]
-sorted_months = [m for m in month_order if m in df['Month'].unique()]
+
+# Year / Month / Entity / MP Code options with row counts, each narrowed by
+# the other three dropdowns (and the user's own MP code)
+def filter_options(username, year, month, entity, mpcode):
+    counts = snapshots.facets("invoices", [
+        ("Year", [int(y) for y in year] if year else None),
+        ("Month", month or None),
+        ("Invoice_Entity", entity or None),
+        ("Location", mpcode or None),
+    ], ["Year", "Month", "Invoice_Entity", "Location"], scope=[
+        ("Location", [username] if username != "admin" else None),
+        ("Year", [y for y in snapshots.index_values("invoices", "Year") if y >= 2014]),
+    ])
+    return (
+        snapshots.facet_options({str(y): n for y, n in counts["Year"].items()}, year),
+        snapshots.facet_options(counts["Month"], month, order=month_order),
+        snapshots.facet_options(counts["Invoice_Entity"], entity),
+        snapshots.facet_options(counts["Location"], mpcode),
+    )
 
 def kpi_card(title, value, color="green"):
     color_code = {"green": "#00FF00", "red": "#FF0000", "orange": "#FFA500"}
@@ -52,68 +62,59 @@ def kpi_card(title, value, color="green"):
         }
     )
 
-layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(html.H4("All Region Invoice and Commissions Report", className="text-white mt-3"), width=10)
-    ], className="mb-4"),
-
-    dbc.Row([
-        dbc.Col(dcc.Dropdown(options=[{"label": y, "value": y} for y in sorted(df["Year"].unique())],
-                             placeholder="Year", id="year-filter", className="text-dark", multi=True), width=3),
-        dbc.Col(dcc.Dropdown(options=[{"label": m, "value": m} for m in sorted_months],
-                             placeholder="Month", id="month-filter", className="text-dark", multi=True), width=3),
-        dbc.Col(dcc.Dropdown(options=[{"label": e, "value": e} for e in sorted(df["Invoice_Entity"].dropna().unique())],
-                             placeholder="Invoice Entity", id="entity-filter", className="text-dark", multi=True), width=3),
-        dbc.Col(dcc.Dropdown(id="mpcode-filter", placeholder="MP Code", className="text-dark", multi=True), width=3),
-    ], className="mb-3"),
-
-    dbc.Row(id="kpis", className="mb-4 d-flex flex-row flex-wrap", style={"gap": "10px"}),
-
-    dbc.Row([
-        dbc.Col(html.Div(id="data-table", style={
-            "backgroundColor": "#2d2d2d", "padding": "10px", "borderRadius": "10px", "color": "white",
-            "overflowX": "auto", "maxHeight": "500px", "overflowY": "auto"
-        }), width=8),
-
-        dbc.Col([
-            dcc.Graph(id="line-chart", style={"height": "350px"}),
-            dcc.Graph(id="donut-chart", style={"height": "350px"})
-        ], width=4)
-    ]),
-
-    dbc.Row([
-        dbc.Col(html.Button("Export Table", id="export-button", n_clicks=0, className="btn btn-warning")),
-        dcc.Download(id="download-table-csv")
-    ], className="mt-3")
-], fluid=True, style={"backgroundColor": "#121212", "padding": "20px"})
+# Built on demand so the invoice snapshot is only read once it is loaded
+def layout():
+    months = invoice_values("Month")
+    sorted_months = [m for m in month_order if m in months]
+
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(html.H4("All Region Invoice and Commissions Report", className="text-white mt-3"), width=10)
+        ], className="mb-4"),
+
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(options=[{"label": str(y), "value": str(y)} for y in invoice_values("Year")],
+                                 placeholder="Year", id="year-filter", className="text-dark", multi=True), width=3),
+            dbc.Col(dcc.Dropdown(options=[{"label": m, "value": m} for m in sorted_months],
+                                 placeholder="Month", id="month-filter", className="text-dark", multi=True), width=3),
+            dbc.Col(dcc.Dropdown(options=[{"label": e, "value": e} for e in invoice_values("Invoice_Entity")],
+                                 placeholder="Invoice Entity", id="entity-filter", className="text-dark", multi=True), width=3),
+            dbc.Col(dcc.Dropdown(id="mpcode-filter", placeholder="MP Code", className="text-dark", multi=True), width=3),
+        ], className="mb-3"),
+
+        dbc.Row(id="kpis", className="mb-4 d-flex flex-row flex-wrap", style={"gap": "10px"}),
+
+        dbc.Row([
+            dbc.Col(html.Div(id="data-table", style={
+                "backgroundColor": "#2d2d2d", "padding": "10px", "borderRadius": "10px", "color": "white",
+                "overflowX": "auto", "maxHeight": "500px", "overflowY": "auto"
+            }), width=8),
+
+            dbc.Col([
+                dcc.Graph(id="line-chart", style={"height": "350px"}),
+                dcc.Graph(id="donut-chart", style={"height": "350px"})
+            ], width=4)
+        ]),
+
+        dbc.Row([
+            dbc.Col(html.Button("Export Table", id="export-button", n_clicks=0, className="btn btn-warning")),
+            dcc.Download(id="download-table-csv")
+        ], className="mt-3")
+    ], fluid=True, style={"backgroundColor": "#121212", "padding": "20px"})
 
+@memo.memoize("invoices")
 def update_dashboard(year, month, entity, mpcode, user_data):
     username = user_data.get("username") if user_data else "admin"
-    dff = df.copy()
-
-    if username != 'admin':
-        dff = dff[dff["Location"] == username]
-
-    if year:
-        dff = dff[dff["Year"].isin(year)]
-    if month:
-        dff = dff[dff["Month"].isin(month)]
-    if entity:
-        dff = dff[dff["Invoice_Entity"].isin(entity)]
-    if mpcode:
-        dff = dff[dff["Location"].isin(mpcode)]
+    dff = filtered_invoices(username, year, month, entity, mpcode)
 
     total_invoice_amount = dff["Invoice_Amount_USD"].sum()
 
-    summary = dff.copy()
-    summary["Paid_Amount"] = summary["Invoice_Amount_USD"] - summary["Quantity"]
-    summary["Receivables"] = summary["Invoice_Amount_USD"] - summary["Paid_Amount"]
-
-    by_mp = summary.groupby("Location").agg({
+    # Receivables here are the outstanding Quantity (Invoice amount - Paid amount)
+    by_mp = dff.groupby("Location", observed=True).agg({
         "Invoice_Amount_USD": "sum",
         "Paid_Amount": "sum",
-        "Receivables": "sum"
-    }).reset_index()
+        "Quantity": "sum"
+    }).reset_index().rename(columns={"Quantity": "Receivables"})
     by_mp["Paid %"] = round((by_mp["Paid_Amount"] / by_mp["Invoice_Amount_USD"]) * 100, 0)
     by_mp["Receivables %"] = (by_mp["Receivables"] / by_mp["Invoice_Amount_USD"]) * 100
 
@@ -171,6 +172,7 @@ def update_dashboard(year, month, entity, mpcode, user_data):
 
     # Charts
     line_df = dff.groupby("Year")["Invoice_Amount_USD"].sum().reset_index()
+    line_df["Year"] = line_df["Year"].astype(str)
     line_fig = px.line(line_df, x="Year", y="Invoice_Amount_USD", markers=True)
     line_fig.update_layout(
         paper_bgcolor="#1e1e1e", plot_bgcolor="#1e1e1e", font_color="white",
@@ -186,11 +188,10 @@ def update_dashboard(year, month, entity, mpcode, user_data):
     )])
     donut_fig.update_layout(paper_bgcolor="#1e1e1e", font_color="white", title="Invoice Breakdown", showlegend=True)
 
-    mp_options = [{"label": mp, "value": mp} for mp in sorted(dff["Location"].dropna().unique())]
-    if username != 'admin':
-        mp_options = [{"label": username, "value": username}]
+    year_options, month_options, entity_options, mp_options = filter_options(username, year, month, entity, mpcode)
 
-    return [dbc.Col(card, width="auto") for card in kpi_cards], table, line_fig, donut_fig, mp_options
+    return ([dbc.Col(card, width="auto") for card in kpi_cards], table, line_fig, donut_fig,
+            year_options, month_options, entity_options, mp_options)
 
 def register_callbacks(app):
     app.callback(
@@ -198,12 +199,17 @@ def register_callbacks(app):
          Output("data-table", "children"),
          Output("line-chart", "figure"),
          Output("donut-chart", "figure"),
+         # The year / month / entity dropdown ids are shared with Receivables Details
+         Output("year-filter", "options", allow_duplicate=True),
+         Output("month-filter", "options", allow_duplicate=True),
+         Output("entity-filter", "options", allow_duplicate=True),
          Output("mpcode-filter", "options")],
         [Input("year-filter", "value"),
          Input("month-filter", "value"),
          Input("entity-filter", "value"),
          Input("mpcode-filter", "value"),
-         Input("user-store", "data")]
+         Input("user-store", "data")],
+        prevent_initial_call="initial_duplicate"
     )(update_dashboard)
 
     @app.callback(
@@ -217,29 +223,15 @@ def register_callbacks(app):
         prevent_initial_call=True
     )
     def export_table(n_clicks, year, month, entity, mpcode, user_data):
-        dff = df.copy()
         username = user_data.get("username") if user_data else "admin"
+        dff = filtered_invoices(username, year, month, entity, mpcode)
 
-        if username != "admin":
-            dff = dff[dff["Location"] == username]
-        if year:
-            dff = dff[dff["Year"].isin(year)]
-        if month:
-            dff = dff[dff["Month"].isin(month)]
-        if entity:
-            dff = dff[dff["Invoice_Entity"].isin(entity)]
-        if mpcode:
-            dff = dff[dff["Location"].isin(mpcode)]
-
-        summary = dff.copy()
-        summary["Paid_Amount"] = summary["Invoice_Amount_USD"] - summary["Quantity"]
-        summary["Receivables"] = summary["Invoice_Amount_USD"] - summary["Paid_Amount"]
-
-        by_mp = summary.groupby("Location").agg({
+        # Receivables here are the outstanding Quantity (Invoice amount - Paid amount)
+        by_mp = dff.groupby("Location", observed=True).agg({
             "Invoice_Amount_USD": "sum",
             "Paid_Amount": "sum",
-            "Receivables": "sum"
-        }).reset_index()
+            "Quantity": "sum"
+        }).reset_index().rename(columns={"Quantity": "Receivables"})
         by_mp["Paid %"] = round((by_mp["Paid_Amount"] / by_mp["Invoice_Amount_USD"]) * 100, 0)
         by_mp["Receivables %"] = (by_mp["Receivables"] / by_mp["Invoice_Amount_USD"]) * 100
 
@@ -1,31 +1,9 @@
 import pandas as pd
+import snapshots
+import memo
 import plotly.express as px
 import plotly.graph_objects as go
 from dash import dcc, html, Input, Output
-from sqlalchemy import create_engine
-import urllib
-
-# ✅ Fetch data from SQL Server
-server = 'valentasql.database.windows.net'
-database = 'Xero_CRM'
-username = 'valdb'
-password = 'Valenta@1234'
-table_name = 'dbo.DEALS'
-
-params = urllib.parse.quote_plus(
-    f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-    f"SERVER={server};"
-    f"DATABASE={database};"
-    f"UID={username};"
-    f"PWD={password};"
-)
-
-engine = create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
-df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-
-# ✅ Data preprocessing
-df["Closing Date"] = pd.to_datetime(df["Closing Date"], errors="coerce")
-df["Closing Month"] = df["Closing Date"].dt.strftime("%Y-%m")
 
 # ✅ Time references
 current_month = pd.Timestamp.today().strftime("%Y-%m")
@@ -36,9 +14,6 @@ closing_month_options = {
     "Next Month": next_month
 }
 
-# ✅ Filter only Active employees once
-df = df[df["Status"].str.lower() == "active"]
-
 # ✅ Constants
 service_lines = ["Digital Transformation", "Staff Augmentation", "Consulting Milestone", "Consulting"]
 color_map = {
@@ -50,62 +25,72 @@ color_map = {
 stage_order = ["Agreement Signed", "Issue Agreement", "1st Meeting Complete", "Contact Made", "Proposal Sent"]
 
 # ✅ Layout
-graphs_layout = html.Div(
-    style={"backgroundColor": "#222222", "color": "white", "padding": "20px"},
-    children=[
-        html.Div(
-            style={"display": "flex", "justifyContent": "center", "gap": "20px", "marginBottom": "20px"},
-            children=[
-                dcc.Dropdown(
-                    id="deal-owner-dropdown",
-                    options=[{"label": owner, "value": owner} for owner in sorted(df["Deal Owner Name"].dropna().unique())],
-                    placeholder="Select Deal Owner",
-                    style={"width": "300px", "color": "black", "fontSize": "16px", "background": "white", "borderRadius": "5px"},
-                    multi=True
-                ),
-                dcc.Dropdown(
-                    id="closing-month-dropdown",
-                    options=[{"label": label, "value": label} for label in closing_month_options.keys()],
-                    placeholder="Select Closing Month",
-                    style={"width": "300px", "color": "black", "fontSize": "16px", "background": "white", "borderRadius": "5px"},
-                    multi=True
-                ),
-            ]
-        ),
-
-        html.Div(
-            style={"display": "grid", "gridTemplateColumns": "1fr 1fr", "gap": "20px"},
-            children=[
-                dcc.Graph(id="lead-source-graph", style={"height": "500px", "width": "100%"}),
-                dcc.Graph(id="billing-company-graph", style={"height": "500px", "width": "100%"}),
-                dcc.Graph(id="service-line-graph", style={"height": "400px", "width": "100%"}),
-                dcc.Graph(id="stage-graph", style={"height": "400px", "width": "100%"}),
-            ]
-        ),
-    ]
-)
+def graphs_layout():
+    # ✅ Shared deals snapshot (snapshots.py), already limited to active deals
+    df = snapshots.deals()
+
+    return html.Div(
+        style={"backgroundColor": "#222222", "color": "white", "padding": "20px"},
+        children=[
+            html.Div(
+                style={"display": "flex", "justifyContent": "center", "gap": "20px", "marginBottom": "20px"},
+                children=[
+                    dcc.Dropdown(
+                        id="deal-owner-dropdown",
+                        options=[{"label": owner, "value": owner} for owner in sorted(df["Deal Owner Name"].dropna().unique())],
+                        placeholder="Select Deal Owner",
+                        style={"width": "300px", "color": "black", "fontSize": "16px", "background": "white", "borderRadius": "5px"},
+                        multi=True
+                    ),
+                    dcc.Dropdown(
+                        id="closing-month-dropdown",
+                        options=[{"label": label, "value": label} for label in closing_month_options.keys()],
+                        placeholder="Select Closing Month",
+                        style={"width": "300px", "color": "black", "fontSize": "16px", "background": "white", "borderRadius": "5px"},
+                        multi=True
+                    ),
+                ]
+            ),
+
+            html.Div(
+                style={"display": "grid", "gridTemplateColumns": "1fr 1fr", "gap": "20px"},
+                children=[
+                    dcc.Graph(id="lead-source-graph", style={"height": "500px", "width": "100%"}),
+                    dcc.Graph(id="billing-company-graph", style={"height": "500px", "width": "100%"}),
+                    dcc.Graph(id="service-line-graph", style={"height": "400px", "width": "100%"}),
+                    dcc.Graph(id="stage-graph", style={"height": "400px", "width": "100%"}),
+                ]
+            ),
+        ]
+    )
 
 # ✅ Callback
 def register_graphs_callbacks(app):
     @app.callback(
-        [Output("lead-source-graph", "figure"),
+        [Output("deal-owner-dropdown", "options"),
+         Output("lead-source-graph", "figure"),
          Output("billing-company-graph", "figure"),
          Output("service-line-graph", "figure"),
          Output("stage-graph", "figure")],
         [Input("deal-owner-dropdown", "value"),
          Input("closing-month-dropdown", "value")]
     )
+    @memo.memoize("deals")
     def update_graphs(selected_deal_owners, selected_closing_months):
-        df_filtered = df.copy()
-
-        if selected_deal_owners:
-            df_filtered = df_filtered[df_filtered["Deal Owner Name"].isin(selected_deal_owners)]
+        selected_month_values = [
+            closing_month_options[m] for m in selected_closing_months if m in closing_month_options
+        ] if selected_closing_months else None
+        # Deals cube cells (deal counts per owner, stage, service line, lead
+        # source, billing company and closing month) for the selection
+        filters = [
+            ("Deal Owner Name", selected_deal_owners or None),
+            ("Closing Month", selected_month_values),
+        ]
+        df_filtered = snapshots.cube_select("deals", filters)
 
-        if selected_closing_months:
-            selected_month_values = [
-                closing_month_options[m] for m in selected_closing_months if m in closing_month_options
-            ]
-            df_filtered = df_filtered[df_filtered["Closing Month"].isin(selected_month_values)]
+        # ✅ Owner options with deal counts for the selected closing months
+        counts = snapshots.facets("deals", filters, ["Deal Owner Name"])
+        owner_options = snapshots.facet_options(counts["Deal Owner Name"], selected_deal_owners)
 
         # ✅ Lead Source Graph
         lead_sources = [
@@ -113,7 +98,7 @@ def register_graphs_callbacks(app):
             "Client Referral", "Conference", "LinkedIn", "Advertisement", "Chat", "Social Media"
         ]
         df_lead = df_filtered[df_filtered["Lead Source"].isin(lead_sources)]
-        df_lead_summary = df_lead["Lead Source"].value_counts().reset_index()
+        df_lead_summary = df_lead.groupby("Lead Source", observed=True)["Rows"].sum().sort_values(ascending=False).reset_index()
         df_lead_summary.columns = ["Lead Source", "Deals_In_Pipeline1"]
         df_lead_summary = df_lead_summary.sort_values(by="Deals_In_Pipeline1", ascending=True)
 
@@ -136,7 +121,7 @@ def register_graphs_callbacks(app):
             "Valenta EU", "Valenta India", "Valenta LATAM", "Valenta TT"
         ]
         df_bill = df_filtered[df_filtered["Billing Company"].isin(billing_companies)]
-        df_bill_summary = df_bill["Billing Company"].value_counts().reset_index()
+        df_bill_summary = df_bill.groupby("Billing Company", observed=True)["Rows"].sum().sort_values(ascending=False).reset_index()
         df_bill_summary.columns = ["Billing Company", "Deals_In_Pipeline1"]
         df_bill_summary = df_bill_summary.sort_values(by="Deals_In_Pipeline1", ascending=False)
 
@@ -154,7 +139,7 @@ def register_graphs_callbacks(app):
 
         # ✅ Service Line Donut Chart
         df_service_filtered = df_filtered[df_filtered["Service Line"].isin(service_lines)]
-        df_service_summary = df_service_filtered.groupby("Service Line").size().reset_index(name="Deals")
+        df_service_summary = df_service_filtered.groupby("Service Line", observed=True)["Rows"].sum().reset_index(name="Deals")
 
         fig_service = px.pie(
             df_service_summary, names="Service Line", values="Deals", hole=0.6,
@@ -165,10 +150,10 @@ def register_graphs_callbacks(app):
 
         # ✅ Stage vs Service Line Stacked Bar
         df_stage_filtered = df_filtered[df_filtered["Stage"].isin(stage_order)]
-        df_stage_grouped = df_stage_filtered.groupby(["Stage", "Service Line"]).size().reset_index(name="Deals")
+        df_stage_grouped = df_stage_filtered.groupby(["Stage", "Service Line"], observed=True)["Rows"].sum().reset_index(name="Deals")
 
         if not df_stage_grouped.empty:
-            df_stage_grouped["Percentage"] = df_stage_grouped.groupby("Stage")["Deals"].transform(lambda x: x / x.sum())
+            df_stage_grouped["Percentage"] = df_stage_grouped.groupby("Stage", observed=True)["Deals"].transform(lambda x: x / x.sum())
             fig_stage = px.bar(
                 df_stage_grouped, x="Stage", y="Percentage", color="Service Line",
                 color_discrete_map=color_map, category_orders={"Stage": stage_order},
@@ -194,4 +179,4 @@ def register_graphs_callbacks(app):
                 font=dict(color="white")
             )
 
-        return fig_lead, fig_bill, fig_service, fig_stage
+        return owner_options, fig_lead, fig_bill, fig_service, fig_stage
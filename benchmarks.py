@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import db
+import snapshots
+
+# Offline measurements of the snapshot layer, run against the configured
+# database (or a warm SNAPSHOT_CACHE_DIR):
+#
+#   python benchmarks.py dtypes
+#   python benchmarks.py load
+#   python benchmarks.py filters [scale]   (scale: replicate the invoices N times)
+#   python benchmarks.py cube [scale]
+#   python benchmarks.py facets [scale]
+#   python benchmarks.py commission [rows]   (local SQLite stand-in, no database needed)
+
+# Filter columns each page applies with .isin(), in callback order
+PAGE_FILTERS = {
+    "Overview": ("invoices", ["Year", "Month", "Invoice_Entity", "Location"]),
+    "Entity Breakdown": ("invoices", ["Year", "Month"]),
+    "Invoice Details": ("invoices", ["Year", "Month", "Invoice_Entity", "MP"]),
+    "Receivables Details": ("invoices", ["Year", "Month", "Invoice_Entity", "MP"]),
+    "Client Pipeline": ("deals", ["Stage", "Deal Owner Name", "Closing Month"]),
+    "Franchise Pipeline": ("deals", ["Stage", "Deal Owner Name", "Closing Month", "Region"]),
+    "Pipeline by Service and Lead": ("deals", ["Deal Owner Name", "Closing Month", "Lead Source", "Billing Company"]),
+    "Deals Closing": ("deals", ["Deal Owner Name", "Service Line"]),
+    "Sales Cycle": ("deals", ["Deal Owner Name", "Billing Company"]),
+}
+
+
+def best_of(fn, repeat=20):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def as_strings(frame):
+    # The frame as it was before categoricals: one Python string per cell
+    plain = frame.copy()
+    for col in plain.columns:
+        if isinstance(plain[col].dtype, pd.CategoricalDtype):
+            plain[col] = plain[col].astype(object)
+        elif col == "Year":
+            plain[col] = plain[col].astype("int64")
+    return plain
+
+
+def apply_filters(frame, selections):
+    dff = frame
+    for col, values in selections:
+        dff = dff[dff[col].isin(values)]
+    return dff
+
+
+def dtypes():
+    frames = {name: snapshots.get(name).frame for name in ("invoices", "deals")}
+    plain = {name: as_strings(frame) for name, frame in frames.items()}
+
+    print("Memory (deep)")
+    print(f"  {'dataset':<12} {'strings':>12} {'compact':>12}")
+    for name, frame in frames.items():
+        before = plain[name].memory_usage(deep=True).sum() / 1024 ** 2
+        after = frame.memory_usage(deep=True).sum() / 1024 ** 2
+        print(f"  {name:<12} {before:>10.1f}MB {after:>10.1f}MB")
+
+    print("Filter latency (best of 20)")
+    print(f"  {'page':<30} {'strings':>10} {'compact':>10}")
+    for page, (name, columns) in PAGE_FILTERS.items():
+        frame = frames[name]
+        columns = [col for col in columns if col in frame.columns]
+        # Select about half of the values of every filter, like a user would
+        selections = []
+        for col in columns:
+            values = list(pd.unique(frame[col].dropna()))
+            selections.append((col, values[: max(1, len(values) // 2)]))
+        before = best_of(lambda: apply_filters(plain[name], selections))
+        after = best_of(lambda: apply_filters(frame, selections))
+        print(f"  {page:<30} {before * 1000:>8.2f}ms {after * 1000:>8.2f}ms")
+
+
+def load():
+    # Peak Python/numpy allocations while fetching and preparing each table,
+    # reading the whole result at once vs streaming it in chunks
+    print(f"Load peak memory (tracemalloc), chunks of {db.CHUNK_ROWS} rows")
+    print(f"  {'dataset':<20} {'all at once':>12} {'chunked':>12} {'final':>10} {'seconds (traced)':>16}")
+    for name, dataset in snapshots._datasets.items():
+        results = []
+        for chunksize in (0, db.CHUNK_ROWS):
+            tracemalloc.start()
+            start = time.perf_counter()
+            frame, _ = dataset.fetch(chunksize=chunksize)
+            frame = dataset.finish(frame)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append((peak / 1024 ** 2, elapsed))
+        final = frame.memory_usage(deep=True).sum() / 1024 ** 2
+        (whole, whole_s), (chunked, chunked_s) = results
+        print(f"  {name:<20} {whole:>10.1f}MB {chunked:>10.1f}MB {final:>8.1f}MB {whole_s:>7.2f}s /{chunked_s:>6.2f}s")
+
+
+def filters(scale=1):
+    # Dropdown combinations resolved by .isin() chains vs the bitmap index
+    dataset = snapshots._datasets["invoices"]
+    frame = snapshots.invoices()
+    if int(scale) > 1:
+        frame = dataset.finish(snapshots.concat([frame] * int(scale), dataset.categories))
+    start = time.perf_counter()
+    index = snapshots.BitmapIndex(frame, dataset.indexed)
+    build = time.perf_counter() - start
+    bitmap_bytes = sum(b.nbytes for bitmaps in index.bitmaps.values() for b in bitmaps.values())
+    print(f"Invoices: {len(frame):,} rows, index built in {build * 1000:.0f}ms, {bitmap_bytes / 1024 ** 2:.1f}MB")
+
+    def values(col, share):
+        found = sorted(index.bitmaps[col])
+        return found[: max(1, int(len(found) * share))]
+
+    cases = {
+        "one year": [("Year", values("Year", 0.1))],
+        "year + month": [("Year", values("Year", 0.3)), ("Month", values("Month", 0.25))],
+        "year + month + entity": [("Year", values("Year", 0.5)), ("Month", values("Month", 0.5)),
+                                  ("Invoice_Entity", values("Invoice_Entity", 0.5))],
+        "all four + user": [("MP", values("MP", 0.2)), ("Year", values("Year", 0.5)), ("Month", values("Month", 0.5)),
+                            ("Invoice_Entity", values("Invoice_Entity", 0.5)), ("MP", values("MP", 0.5))],
+    }
+    print(f"  {'selection':<24} {'rows':>10} {'isin chain':>12} {'bitmap':>10}")
+    for label, selection in cases.items():
+        rows = len(apply_filters(frame, selection))
+
+        def bitmap():
+            return frame.take(np.flatnonzero(index.mask(frame, selection)))
+        chain = best_of(lambda: apply_filters(frame, selection), repeat=10)
+        bitmap_time = best_of(bitmap, repeat=10)
+        print(f"  {label:<24} {rows:>10,} {chain * 1000:>10.1f}ms {bitmap_time * 1000:>8.1f}ms")
+
+
+def cube(scale=1):
+    # Overview's per-MP table and yearly totals from raw rows vs the cube
+    dataset = snapshots._datasets["invoices"]
+    frame = snapshots.invoices()
+    if int(scale) > 1:
+        frame = dataset.finish(snapshots.concat([frame] * int(scale), dataset.categories))
+    start = time.perf_counter()
+    cells = snapshots.build_cube(frame, *dataset.cube)
+    build = time.perf_counter() - start
+    print(f"Invoices: {len(frame):,} rows, cube of {len(cells):,} cells built in {build * 1000:.0f}ms")
+
+    years = sorted(frame["Year"].unique())
+    selection = [("Year", years[len(years) // 2:])]
+    measures = ["Invoice_Amount_USD", "Paid_Amount", "Quantity"]
+
+    def summarize(source):
+        dff = apply_filters(source, selection)
+        dff.groupby("Location", observed=True)[measures].sum()
+        dff.groupby("Year")["Invoice_Amount_USD"].sum()
+        return dff["Invoice_Amount_USD"].sum()
+    raw = best_of(lambda: summarize(frame), repeat=10)
+    cubed = best_of(lambda: summarize(cells), repeat=10)
+    print(f"  Overview aggregates: raw rows {raw * 1000:.1f}ms, cube {cubed * 1000:.2f}ms")
+
+
+def facets(scale=1):
+    # Options and counts for the four invoice dropdowns: value_counts over the
+    # rows matching the other filters vs popcounts on the bitmap index
+    dataset = snapshots._datasets["invoices"]
+    frame = snapshots.invoices()
+    if int(scale) > 1:
+        frame = dataset.finish(snapshots.concat([frame] * int(scale), dataset.categories))
+    index = snapshots.BitmapIndex(frame, dataset.indexed)
+    columns = ["Year", "Month", "Invoice_Entity", "MP"]
+    selection = [(col, sorted(index.bitmaps[col])[::2]) for col in columns]
+
+    def scanned():
+        for col in columns:
+            dff = apply_filters(frame, [f for f in selection if f[0] != col])
+            dff[col].value_counts()
+
+    def counted():
+        for col in columns:
+            bits = index.combine(frame, [f for f in selection if f[0] != col])
+            index.counts(col, bits)
+    print(f"Invoices: {len(frame):,} rows, options for {len(columns)} dropdowns")
+    print(f"  value_counts {best_of(scanned, repeat=10) * 1000:.1f}ms, bitmap counts {best_of(counted, repeat=10) * 1000:.1f}ms")
+
+
+def commission(rows=200000):
+    # Commission Details' month query on a local SQLite stand-in with an
+    # index on Invoice_Date: the year and month of the column compared with
+    # values formatted into the text (the old query's shape) vs the bound
+    # half-open range. Both use built-in SQLite functions (strftime() stands
+    # in for YEAR()/MONTH()), so the difference is the query shape: a scan
+    # of every row vs an index range. This shows the shape only; it is not a
+    # SQL Server timing.
+    import datetime
+    import random
+    import sqlite3
+    import tempfile
+    import sqlalchemy
+    import Commission_Detail
+
+    path = os.path.join(tempfile.mkdtemp(), "dbo.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("""CREATE TABLE [MP/MD COMMISSIONS] (Location TEXT, Department TEXT, Client_Name TEXT,
+                        Invoice_Description TEXT, Invoice_Date TEXT, Invoice_Amount REAL, FullyPaidOnDate TEXT,
+                        MP_Commission REAL, MD_Commission REAL, AccountCode TEXT)""")
+        first = datetime.date(2018, 1, 1)
+        conn.executemany("INSERT INTO [MP/MD COMMISSIONS] VALUES (?,?,?,?,?,?,?,?,?,?)", [
+            (f"MP {i % 40}", f"MD {i % 7}", f"Client {i % 900}", "Services",
+             (first + datetime.timedelta(days=random.randrange(8 * 365))).isoformat(), 1000.0, None, 100.0, 50.0, "200")
+            for i in range(int(rows))
+        ])
+        conn.execute("CREATE INDEX ix_invoice_date ON [MP/MD COMMISSIONS] (Invoice_Date)")
+
+    engine = sqlalchemy.create_engine("sqlite://")
+
+    @sqlalchemy.event.listens_for(engine, "connect")
+    def attach(conn, record):
+        conn.execute(f"ATTACH DATABASE '{path}' AS dbo")
+
+    query = Commission_Detail.commission_part_sql(0)
+    months = [(str(2018 + i % 8), 1 + i % 12) for i in range(24)]
+
+    def literal():
+        # Same statement, with the old WHERE clause
+        with engine.connect() as conn:
+            for year, month in months:
+                pd.read_sql(sqlalchemy.text(query.replace(
+                    "[Invoice_Date] >= :start AND [Invoice_Date] < :end",
+                    f"CAST(strftime('%Y', [Invoice_Date]) AS INTEGER) = {year} "
+                    f"AND CAST(strftime('%m', [Invoice_Date]) AS INTEGER) = {month}",
+                )), conn)
+
+    def bound():
+        with engine.connect() as conn:
+            for year, month in months:
+                start, end = Commission_Detail.month_range(year, month)
+                pd.read_sql(sqlalchemy.text(query), conn, params={"start": start, "end": end})
+
+    print(f"[MP/MD COMMISSIONS] SQLite stand-in (not SQL Server): {int(rows):,} rows, {len(months)} month selections")
+    print(f"  year/month literals {best_of(literal, repeat=3) / len(months) * 1000:.1f}ms per query, "
+          f"bound range {best_of(bound, repeat=3) / len(months) * 1000:.1f}ms per query")
+    engine.dispose()
+    os.remove(path)
+
+
+COMMANDS = {"dtypes": dtypes, "load": load, "filters": filters, "cube": cube, "facets": facets, "commission": commission}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        sys.exit(f"usage: python benchmarks.py {{{','.join(COMMANDS)}}} [args]")
+    COMMANDS[sys.argv[1]](*sys.argv[2:])
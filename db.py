@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+import urllib
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy.pool import QueuePool
+
+# --- SQL Server Connection ---
+server = os.environ.get("DB_SERVER", 'valentasql.database.windows.net')
+database = os.environ.get("DB_NAME", 'Xero_CRM')
+username = os.environ.get("DB_USER", 'valdb')
+password = os.environ.get("DB_PASSWORD", 'Valenta@1234')
+driver = os.environ.get("DB_DRIVER", 'ODBC Driver 17 for SQL Server')
+
+# --- Pool settings (one pool per gunicorn worker) ---
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+# Azure SQL closes idle connections after ~30 minutes, so recycle before that
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1500))
+POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+# Rows per chunk when streaming large results (0 = read everything at once)
+CHUNK_ROWS = int(os.environ.get("DB_CHUNK_ROWS", 50000))
+
+params = urllib.parse.quote_plus(
+    f"DRIVER={{{driver}}};"
+    f"SERVER={server};DATABASE={database};UID={username};PWD={password};"
+)
+connection_url = os.environ.get("DB_URL", f"mssql+pyodbc:///?odbc_connect={params}")
+
+_engine = None
+_engine_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"queries": 0, "errors": 0, "query_seconds": 0.0, "max_query_seconds": 0.0}
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if connection_url.startswith("sqlite"):
+                    # Local stand-in for development; SQLite does not take pool sizing
+                    _engine = sqlalchemy.create_engine(connection_url)
+                else:
+                    _engine = sqlalchemy.create_engine(
+                        connection_url,
+                        poolclass=QueuePool,
+                        pool_size=POOL_SIZE,
+                        max_overflow=MAX_OVERFLOW,
+                        pool_timeout=POOL_TIMEOUT,
+                        pool_recycle=POOL_RECYCLE,
+                        pool_pre_ping=POOL_PRE_PING,
+                    )
+    return _engine
+
+
+def _record(seconds, failed=False):
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats["query_seconds"] += seconds
+        _stats["max_query_seconds"] = max(_stats["max_query_seconds"], seconds)
+        if failed:
+            _stats["errors"] += 1
+
+
+def read_frame(sql, params=None):
+    # Run a query with :name bound parameters and return the result as a DataFrame
+    start = time.perf_counter()
+    try:
+        with get_engine().connect() as conn:
+            df = pd.read_sql(sqlalchemy.text(sql), conn, params=params or {})
+    except Exception:
+        _record(time.perf_counter() - start, failed=True)
+        raise
+    _record(time.perf_counter() - start)
+    return df
+
+
+def read_chunks(sql, params=None, chunksize=CHUNK_ROWS):
+    # Like read_frame, but yields the result in DataFrames of chunksize rows
+    # as they arrive, so callers can shrink each chunk before the next one
+    if not chunksize:
+        yield read_frame(sql, params)
+        return
+    start = time.perf_counter()
+    try:
+        with get_engine().connect() as conn:
+            conn = conn.execution_options(stream_results=True)
+            for chunk in pd.read_sql(sqlalchemy.text(sql), conn, params=params or {}, chunksize=chunksize):
+                yield chunk
+    except Exception:
+        _record(time.perf_counter() - start, failed=True)
+        raise
+    _record(time.perf_counter() - start)
+
+
+def pool_stats():
+    pool = get_engine().pool
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_query_seconds"] = stats["query_seconds"] / stats["queries"] if stats["queries"] else 0.0
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "pool_size": pool.size(),
+            "max_overflow": MAX_OVERFLOW,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    stats["status"] = pool.status()
+    return stats
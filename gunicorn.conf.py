@@ -0,0 +1,30 @@
+import os
+
+# Loaded automatically by `gunicorn main:server` (see Dockerfile).
+#
+# Workers are not preloaded: each one imports main.py and runs its own
+# snapshot loader/refresher threads (threads do not survive a fork). The
+# snapshot frames are still partly shared, because every worker memory-maps
+# the same Arrow files in SNAPSHOT_CACHE_DIR (see snapshots.py for which
+# columns stay on the mapping); categorical columns and per-request work are
+# private. Check a live worker with GET /memory and add up Pss_kb over the
+# workers for the real total.
+#
+# Snapshot memory, total Pss over N processes that each read_cache() an
+# 890k-row invoices file (96 MB; the test fixture repeated 300 times) and
+# touch every column, minus an idle process that only imports snapshots.py.
+# Pss summed from /proc/<pid>/smaps_rollup; "private" deep-copies the frame.
+#
+#   workers   private frames   mapped frames
+#      1          227 MB           173 MB
+#      2          304 MB           195 MB
+#      4          454 MB           237 MB
+#      8          755 MB           321 MB
+#
+# i.e. each extra worker costs ~21 MB of snapshot memory instead of ~75 MB,
+# on top of the memory each worker needs for Python, Dash and pandas.
+bind = os.environ.get("GUNICORN_BIND", ":8080")
+# One worker by default, as before; set WEB_CONCURRENCY to add more (each runs
+# its own loader/refresher threads and SQL connection pool, see above)
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+preload_app = False
@@ -1,11 +1,15 @@
 import dash
 from dash import dcc, html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import flask
 import dash_auth
 from flask import request
 import os
+import db
+import memo
+import snapshots
 
 # Import layouts and callbacks
 from Invoice_details import layout as invoice_layout
@@ -24,11 +28,7 @@ from Sales_Cycle import sales_cycle_layout, register_sales_cycle_callbacks
 from Commission_Detail import (
     layout as commission_layout,
     register_callbacks as register_commission_callbacks,
-    location_options,
-    department_options,
-    practice_mp_options,
-    practice_md_options,
-    mp_as_pm_options
+    dropdown_options as commission_dropdown_options
 )
 
 # 1. Define username-password pairs
@@ -89,8 +89,30 @@ app = dash.Dash(
 app.title = "Valenta Invoice & Sales Dashboard"
 app.server.secret_key = '12345678'
 
+# Connection pool statistics for sizing DB_POOL_SIZE / DB_MAX_OVERFLOW
+@server.route("/db-pool")
+def db_pool():
+    return flask.jsonify(db.pool_stats())
+
+# Memory of the worker serving this request (private vs shared snapshot pages)
+@server.route("/memory")
+def memory():
+    return flask.jsonify(snapshots.memory())
+
+# Callback result cache: hits, misses, evictions and size
+@server.route("/memo")
+def memo_stats():
+    return flask.jsonify(memo.stats())
+
+# Readiness: which datasets are loaded (503 until all of them are)
+@server.route("/ready")
+def ready():
+    status = snapshots.status()
+    all_loaded = all(dataset["loaded"] for dataset in status.values())
+    return flask.jsonify({"ready": all_loaded, "datasets": status}), 200 if all_loaded else 503
+
 # 3. Auth setup
-auth = dash_auth.BasicAuth(app, VALID_USERNAME_PASSWORD_PAIRS)
+auth = dash_auth.BasicAuth(app, VALID_USERNAME_PASSWORD_PAIRS, public_routes=["/ready"])
 
 # 4. Main content
 content = html.Div(
@@ -110,6 +132,8 @@ app.layout = html.Div([
     dcc.Location(id="url"),
     dcc.Store(id="user-store", storage_type="session"),
     html.Div(id="sidebar-container"),
+    # Re-renders the sidebar until the commission options are loaded
+    dcc.Interval(id="sidebar-poll", interval=2000),
     content
 ])
 
@@ -128,15 +152,14 @@ def generate_sidebar(username):
     ]
 
     # ✅ Updated to allow all valid commission users (admin or dropdown match)
-    valid_commission_users = set(
-        opt['value'].strip() for opt in (
-            location_options +
-            department_options +
-            practice_mp_options +
-            practice_md_options +
-            mp_as_pm_options
+    # The link is left out until the commission options are loaded: the
+    # sidebar renders on every page view and must never wait for SQL
+    if snapshots.ready("commission_options"):
+        valid_commission_users = set(
+            opt['value'].strip() for options in commission_dropdown_options() for opt in options
         )
-    )
+    else:
+        valid_commission_users = set()
 
     if username == "admin" or username.strip() in valid_commission_users:
         links.append(
@@ -178,13 +201,38 @@ def store_user(pathname):
 # 8. Render sidebar dynamically
 @app.callback(
     Output("sidebar-container", "children"),
-    Input("user-store", "data")
+    Output("sidebar-poll", "disabled"),
+    Input("user-store", "data"),
+    Input("sidebar-poll", "n_intervals")
 )
-def render_sidebar(user_data):
+def render_sidebar(user_data, n_intervals):
     username = user_data.get("username") if user_data else ""
-    return generate_sidebar(username)
+    return generate_sidebar(username), snapshots.ready("commission_options")
 
 # 9. Page routing
+# Datasets a page needs before its layout can be built
+page_datasets = {
+    "/": ["invoices"],
+    "/overview": ["invoices"],
+    "/entity": ["invoices"],
+    "/invoice": ["invoices"],
+    "/receivables": ["invoices"],
+    "/client": ["deals"],
+    "/franchise": ["deals"],
+    "/graphs": ["deals"],
+    "/deals_closing": ["deals"],
+    "/sales_cycle": ["deals"],
+    "/commission_details": ["commission_options", "commission_ledger"],
+}
+
+def loading_layout(datasets):
+    return html.Div([
+        dbc.Spinner(color="light"),
+        html.H4("Loading data...", className="mt-3"),
+        html.P(f"Waiting for: {', '.join(datasets)}", style={"color": "#aaaaaa"}),
+        dcc.Interval(id="page-loading-poll", interval=2000)
+    ], style={"textAlign": "center", "marginTop": "100px"})
+
 @app.callback(
     Output("page-content", "children"),
     Input("url", "pathname")
@@ -196,29 +244,45 @@ def display_page(pathname):
             html.P("To fully log out, please close this browser tab or clear your browser cache."),
             html.P("Due to HTTP Basic Auth limitations, full logout is handled by the browser.")
         ])
+    datasets = page_datasets.get(pathname, [])
+    if not snapshots.ready(*datasets):
+        return loading_layout(datasets)
+
     if pathname in ["/", "/overview"]:
-        return overview_layout
+        return overview_layout()
     elif pathname == "/entity":
-        return entity_layout
+        return entity_layout()
     elif pathname == "/invoice":
-        return invoice_layout
+        return invoice_layout()
     elif pathname == "/receivables":
-        return receivables_layout
+        return receivables_layout()
     elif pathname == "/client":
-        return client_layout
+        return client_layout()
     elif pathname == "/franchise":
-        return franchise_layout
+        return franchise_layout()
     elif pathname == "/graphs":
-        return graphs_layout
+        return graphs_layout()
     elif pathname == "/deals_closing":
-        return deals_closing_layout
+        return deals_closing_layout()
     elif pathname == "/sales_cycle":
-        return sales_cycle_layout
+        return sales_cycle_layout()
     elif pathname == "/commission_details":
-        return commission_layout
+        return commission_layout()
     else:
         return html.H1("404 - Page Not Found", style={"color": "red"})
 
+# Swap the loading placeholder for the real page once its datasets are in
+@app.callback(
+    Output("page-content", "children", allow_duplicate=True),
+    Input("page-loading-poll", "n_intervals"),
+    State("url", "pathname"),
+    prevent_initial_call=True
+)
+def reload_when_ready(n_intervals, pathname):
+    if not snapshots.ready(*page_datasets.get(pathname, [])):
+        raise PreventUpdate
+    return display_page(pathname)
+
 # 10. Register all callbacks
 register_overview_callbacks(app)
 register_entity_callbacks(app)
@@ -229,6 +293,11 @@ register_deals_closing_callbacks(app)
 register_sales_cycle_callbacks(app)
 register_commission_callbacks(app)
 
+# Load datasets in the background (importing this module runs no SQL), then
+# reload INVOICES / DEALS periodically and swap them in atomically
+snapshots.start_loader()
+snapshots.start_refresher()
+
 # 11. Run app
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080, debug=False)
@@ -0,0 +1,125 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from plotly.io.json import to_json_plotly
+
+import snapshots
+
+# --- Callback result cache ---
+# Page callbacks are pure functions of their inputs (dropdown values and the
+# user in user-store) and of the snapshot data, so identical filter states
+# are answered from here instead of being recomputed for every user and
+# every page visit. Entries are keyed by (callback, normalized inputs, data
+# versions), evicted least recently used once the cache is over MEMO_MAX_BYTES
+# (measured as the JSON size of the result) and expire after MEMO_TTL_SECONDS.
+# Entries for a snapshot are dropped as soon as a newer version of it is seen.
+#
+# What is kept is the encoded payload, not the figures and components the
+# callback built: serializing a Plotly figure copies and walks it (several ms
+# per figure), while the JSON-decoded payload is plain dicts and lists that
+# Dash writes out directly. Misses return the same payload, so a response
+# does not depend on whether it came from the cache.
+MAX_BYTES = int(os.environ.get("MEMO_MAX_BYTES", 64 * 1024 ** 2))
+TTL_SECONDS = int(os.environ.get("MEMO_TTL_SECONDS", 600))
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (payload, size, expires_at, versions)
+_versions = {}  # dataset -> latest version seen
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidated": 0, "bytes": 0}
+
+
+def normalize(value):
+    # Hashable form of one callback input. Dash passes multi-select values
+    # as lists, and their order never changes a page's result, so lists are
+    # compared sorted; tuples keep their order.
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalize(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return tuple(sorted((normalize(item) for item in value), key=repr))
+    if isinstance(value, tuple):
+        return tuple(normalize(item) for item in value)
+    return value
+
+
+def _drop(key):
+    _stats["bytes"] -= _entries.pop(key)[1]
+
+
+def _invalidate(versions):
+    # Called with the lock held: forget results built on older snapshots
+    changed = {name for name, version in versions if _versions.get(name) != version}
+    if not changed:
+        return
+    for name, version in versions:
+        _versions[name] = version
+    stale = [key for key, entry in _entries.items() if any(name in changed for name, _ in entry[3])]
+    for key in stale:
+        _drop(key)
+    _stats["invalidated"] += len(stale)
+
+
+def _store(key, result, size, versions):
+    # Called with the lock held
+    if key in _entries:
+        _drop(key)
+    if size > MAX_BYTES:
+        return
+    _entries[key] = (result, size, time.monotonic() + TTL_SECONDS, versions)
+    _stats["bytes"] += size
+    while _stats["bytes"] > MAX_BYTES:
+        _drop(next(iter(_entries)))
+        _stats["evictions"] += 1
+
+
+def memoize(*datasets):
+    # Decorator for a page callback whose result depends on the given
+    # snapshots (none for callbacks that only read SQL, which rely on the TTL)
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            versions = tuple((dataset, snapshots.get(dataset).version) for dataset in datasets)
+            # One entry per argument, in position order
+            key = (name, tuple(normalize(arg) for arg in args), versions)
+            now = time.monotonic()
+            with _lock:
+                _invalidate(versions)
+                entry = _entries.get(key)
+                if entry is not None and entry[2] <= now:
+                    _drop(key)
+                    _stats["expired"] += 1
+                    entry = None
+                if entry is not None:
+                    _entries.move_to_end(key)
+                    _stats["hits"] += 1
+                    return entry[0]
+                _stats["misses"] += 1
+            encoded = to_json_plotly(fn(*args))
+            result = json.loads(encoded)
+            with _lock:
+                _store(key, result, len(encoded), versions)
+            return result
+        return wrapper
+    return decorator
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+        result["entries"] = len(_entries)
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+    result["max_bytes"] = MAX_BYTES
+    result["ttl_seconds"] = TTL_SECONDS
+    return result
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _stats["bytes"] = 0
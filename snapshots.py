@@ -0,0 +1,939 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.api.types import union_categoricals
+import db
+
+# In-memory, per-process snapshots of the shared tables. Each dataset is loaded
+# once, preprocessed once and then read by every page that needs it.
+
+
+class Snapshot:
+    def __init__(self, name, frame, watermark=None, full_loaded_at=None, fingerprint=None):
+        self.name = name
+        self.frame = frame
+        self.loaded_at = pd.Timestamp.now()
+        self.version = self.loaded_at.strftime("%Y%m%d%H%M%S%f")
+        self.rows = len(frame)
+        # Highest change-tracking value seen so far, used for delta refreshes
+        self.watermark = watermark
+        self.full_loaded_at = full_loaded_at or self.loaded_at
+        # Result of the change-detection probe taken just before loading
+        self.fingerprint = fingerprint
+        self.load_seconds = None
+        # True when the frame came from the on-disk cache rather than SQL
+        self.from_cache = False
+        # BitmapIndex over the dataset's filter columns and the pre-aggregated
+        # cube, both built before the snapshot is installed
+        self.index = None
+        self.cube = None
+
+
+class Dataset:
+    # Declares exactly which columns and rows a snapshot needs, so the query
+    # sent to SQL Server only transfers those instead of SELECT *.
+    #
+    # prepare runs on freshly fetched rows only (full load or delta);
+    # recompute runs on the whole frame for time-dependent columns.
+    # key + watermark enable incremental refresh when both columns exist.
+    # sql / probe_sql replace the generated queries for datasets that are not
+    # a projection of a single table.
+    # categories are columns with heavily repeated values (filter dimensions,
+    # but also client names and line descriptions repeated across invoice
+    # lines) stored as pandas categoricals: one integer code per row plus each
+    # distinct string once. Strings are only materialized for the rows a page
+    # actually returns.
+    # indexed columns get a BitmapIndex for select().
+    # cube = (dimensions, measures) pre-aggregates the measures' sums and the
+    # row count per combination of dimension values, for cube_select().
+    def __init__(self, name, table=None, columns=(), where=None, optional_columns=(), prepare=None,
+                 recompute=None, key=None, watermark=None, sql=None, probe_sql=None, categories=(), indexed=(),
+                 cube=None):
+        self.name = name
+        self.table = table
+        self.sql = sql
+        self.probe_sql = probe_sql
+        self.columns = list(columns)
+        self.where = where
+        self.optional_columns = list(optional_columns)
+        self.prepare = prepare
+        self.recompute = recompute
+        self.key = key
+        self.watermark = watermark
+        self.categories = list(categories)
+        self.indexed = list(indexed)
+        self.cube = cube
+        self._incremental = None
+
+    def incremental(self):
+        if self._incremental is None:
+            self._incremental = bool(self.table and self.key and self.watermark) and \
+                {self.key, self.watermark} <= table_columns(self.table)
+        return self._incremental
+
+    def select_columns(self):
+        columns = list(self.columns)
+        if self.optional_columns:
+            available = table_columns(self.table)
+            columns += [col for col in self.optional_columns if col in available]
+        if self.incremental():
+            columns += [col for col in (self.key, self.watermark) if col not in columns]
+        return columns
+
+    def query(self, since=None):
+        if self.sql:
+            return self.sql
+        conditions = [self.where] if self.where else []
+        if since is not None:
+            # Inclusive: rows committed later with the same watermark value as
+            # the last one seen are picked up, and the key merge drops the
+            # copies of rows already in the snapshot
+            conditions.append(f"[{self.watermark}] >= :since")
+        sql = f"SELECT {', '.join(f'[{col}]' for col in self.select_columns())} FROM {self.table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(f"({c})" for c in conditions)
+        return sql
+
+    def fetch(self, since=None, chunksize=db.CHUNK_ROWS):
+        # Rows are streamed in chunks and each chunk is prepared and encoded
+        # before the next one is read, so the raw object-typed rows of the
+        # whole table never exist in memory at the same time
+        frames = []
+        watermark = None
+        params = {"since": since} if since is not None else None
+        for raw in db.read_chunks(self.query(since), params, chunksize):
+            if self.incremental() and not raw.empty:
+                chunk_max = raw[self.watermark].max()
+                if not pd.isna(chunk_max) and (watermark is None or chunk_max > watermark):
+                    watermark = chunk_max
+            frame = self.prepare(raw) if self.prepare else raw
+            del raw
+            frames.append(self.encode(frame))
+        if isinstance(watermark, pd.Timestamp):
+            watermark = watermark.to_pydatetime()
+        return concat(frames, self.categories), watermark
+
+    def encode(self, frame):
+        for col in self.categories:
+            if col in frame.columns and not isinstance(frame[col].dtype, pd.CategoricalDtype):
+                frame[col] = frame[col].astype("category")
+        return frame
+
+    def finish(self, frame):
+        frame = self.encode(frame)
+        return self.recompute(frame) if self.recompute else frame
+
+    def probe(self):
+        # Cheap one-row summary (row count plus max watermark, or an aggregate
+        # checksum) that changes whenever the underlying rows do
+        sql = self.probe_sql
+        if sql is None:
+            if self.incremental():
+                fingerprint = f"MAX([{self.watermark}])"
+            else:
+                columns = ", ".join(f"[{col}]" for col in self.select_columns())
+                fingerprint = f"CHECKSUM_AGG(BINARY_CHECKSUM({columns}))"
+            sql = f"SELECT COUNT_BIG(*) AS row_count, {fingerprint} AS fingerprint FROM {self.table}"
+            if self.where:
+                sql += f" WHERE {self.where}"
+        try:
+            df = db.read_frame(sql)
+            return tuple(tuple(row) for row in df.astype(str).values)
+        except Exception as e:
+            print(f"Error probing {self.name}:", e)
+            return None
+
+
+class BitmapIndex:
+    # One packed bitmap (1 bit per row) per distinct value of each indexed
+    # column. A combination of dropdown selections is resolved as an OR of
+    # bitmaps within a column and an AND across columns, followed by a single
+    # gather of the matching rows, instead of one .isin() scan and one copy
+    # of the frame per filter.
+    def __init__(self, frame, columns):
+        self.rows = len(frame)
+        self.bitmaps = {}
+        for col in columns:
+            if col not in frame.columns:
+                continue
+            series = frame[col]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes, values = series.cat.codes.to_numpy(), series.cat.categories
+            else:
+                codes, values = pd.factorize(series)
+            bitmaps = {}
+            for code, value in enumerate(values):
+                hits = codes == code
+                if hits.any():
+                    bitmaps[value.item() if hasattr(value, "item") else value] = np.packbits(hits)
+            self.bitmaps[col] = bitmaps
+
+    def bits(self, frame, col, values):
+        if callable(values):
+            # Predicate over the whole column, e.g. between() or date_part()
+            return np.packbits(np.asarray(values(frame[col]), dtype=bool))
+        bitmaps = self.bitmaps.get(col)
+        if bitmaps is None:
+            # Not indexed: fall back to a scan of this column only
+            return np.packbits(frame[col].isin(values).to_numpy())
+        result = np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+        for value in values:
+            bitmap = bitmaps.get(value)
+            if bitmap is not None:
+                result |= bitmap
+        return result
+
+    def combine(self, frame, filters):
+        # filters: (column, selected values or predicate) pairs; None means
+        # no filter. Returns the packed AND of all filters, or None.
+        result = None
+        for col, values in filters:
+            if values is None:
+                continue
+            bits = self.bits(frame, col, values)
+            result = bits if result is None else result & bits
+        return result
+
+    def mask(self, frame, filters):
+        result = self.combine(frame, filters)
+        if result is None:
+            return None
+        return np.unpackbits(result, count=self.rows).view(bool)
+
+    def counts(self, col, bits=None):
+        # Matching rows per value of an indexed column, values without any
+        # left out
+        counts = {}
+        for value, bitmap in self.bitmaps[col].items():
+            count = int(POPCOUNT[bitmap if bits is None else bitmap & bits].sum())
+            if count:
+                counts[value] = count
+        return counts
+
+
+# Set bits per byte value, for counting rows in packed bitmaps
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def select(name, filters, columns=None):
+    # Rows of a snapshot matching every filter, limited to the given columns.
+    # All filters are combined into one mask first and only the matching rows
+    # of the needed columns are gathered: no per-filter or full-table copies.
+    snapshot = get(name)
+    frame = snapshot.frame if columns is None else snapshot.frame[columns]
+    mask = snapshot.index.mask(snapshot.frame, filters)
+    if mask is None:
+        return frame
+    return frame.take(np.flatnonzero(mask))
+
+
+def between(start=None, end=None):
+    # Half-open range predicate for select(): start <= value < end
+    def matches(series):
+        mask = series.notna()
+        if start is not None:
+            mask &= series >= start
+        if end is not None:
+            mask &= series < end
+        return mask
+    return matches
+
+
+def date_part(part, values):
+    # Predicate for select() on a part of a date column, e.g. ("year", [2024])
+    def matches(series):
+        return getattr(series.dt, part).isin(values)
+    return matches
+
+
+def build_cube(frame, dimensions, measures):
+    # One row per observed combination of the dimensions (NaN kept as its own
+    # value, so totals still include rows with e.g. no entity), with the sums
+    # of the measures and the number of source rows in "Rows"
+    grouped = frame.groupby([col for col in dimensions if col in frame.columns], observed=True, dropna=False)
+    cube = grouped[list(measures)].sum()
+    cube["Rows"] = grouped.size()
+    return cube.reset_index()
+
+
+def cube_select(name, filters):
+    # Cube cells matching every filter, with the same filter spec as select().
+    # The cube is small, so a plain scan is enough here.
+    cube = get(name).cube
+    mask = np.ones(len(cube), dtype=bool)
+    for col, values in filters:
+        if values is None:
+            continue
+        mask &= np.asarray(values(cube[col]) if callable(values) else cube[col].isin(values), dtype=bool)
+    return cube[mask]
+
+
+def facets(name, filters, columns, scope=()):
+    # Options for a page's dropdowns: for each of columns, the values that
+    # still have rows and how many, given the scope (always applied, e.g. the
+    # user's own invoices) and the other dropdowns' filters. A dropdown's own
+    # selection does not narrow its options, so it can still be widened.
+    snapshot = get(name)
+    index, frame = snapshot.index, snapshot.frame
+    base = index.combine(frame, scope)
+    selected = [(col, index.bits(frame, col, values)) for col, values in filters if values is not None]
+    result = {}
+    for col in columns:
+        bits = base
+        for other, other_bits in selected:
+            if other != col:
+                bits = other_bits if bits is None else bits & other_bits
+        result[col] = index.counts(col, bits)
+    return result
+
+
+def facet_options(counts, selected=None, order=None):
+    # Dropdown options labelled with their row counts. Selected values are
+    # kept (with a count of 0) so the dropdown does not drop them.
+    values = set(counts) | set(selected or [])
+    values = [v for v in order if v in values] if order else sorted(values)
+    return [{"label": f"{v} ({counts.get(v, 0):,})", "value": v} for v in values]
+
+
+def index_values(name, column, scope=()):
+    # Distinct values of an indexed column, e.g. for dropdown options; with a
+    # scope (same spec as select()), only the values that have rows under it
+    if not scope:
+        return sorted(get(name).index.bitmaps[column])
+    return sorted(facets(name, [], [column], scope)[column])
+
+
+def install(name, snapshot):
+    dataset = _datasets[name]
+    if snapshot.index is None:
+        snapshot.index = BitmapIndex(snapshot.frame, dataset.indexed)
+    if snapshot.cube is None and dataset.cube:
+        snapshot.cube = build_cube(snapshot.frame, *dataset.cube)
+    _snapshots[name] = snapshot
+
+
+def concat(frames, categories=()):
+    # pd.concat turns categoricals with different categories back into
+    # strings, so align the categories of every frame first
+    if len(frames) == 1:
+        return frames[0]
+    for col in categories:
+        parts = [frame[col] for frame in frames if col in frame.columns]
+        if len(parts) < len(frames) or not all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            continue
+        union = union_categoricals([part.array for part in parts], sort_categories=True).categories
+        for frame in frames:
+            frame[col] = frame[col].cat.set_categories(union)
+    return pd.concat(frames, ignore_index=True)
+
+
+def table_columns(table):
+    schema, name = table.split(".")
+    try:
+        df = db.read_frame(
+            "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :name",
+            {"schema": schema, "name": name},
+        )
+        return set(df["COLUMN_NAME"])
+    except Exception as e:
+        print(f"Error reading columns of {table}:", e)
+        return set()
+
+
+_datasets = {}
+_snapshots = {}
+_locks = {}
+
+
+def register(dataset):
+    _datasets[dataset.name] = dataset
+    _locks[dataset.name] = threading.Lock()
+
+
+def get(name):
+    snapshot = _snapshots.get(name)
+    if snapshot is None:
+        with _locks[name]:
+            snapshot = _snapshots.get(name)
+            if snapshot is None:
+                dataset = _datasets[name]
+                snapshot = read_cache(name)
+                if snapshot is None:
+                    snapshot = publish(load_full(dataset, dataset.probe()))
+                install(name, snapshot)
+                _errors.pop(name, None)
+    return snapshot
+
+
+def ready(*names):
+    return all(name in _snapshots for name in names)
+
+
+def status():
+    result = {}
+    for name in _datasets:
+        snapshot = _snapshots.get(name)
+        result[name] = {
+            "loaded": snapshot is not None,
+            "rows": snapshot.rows if snapshot else None,
+            "version": snapshot.version if snapshot else None,
+            "loaded_at": snapshot.loaded_at.isoformat() if snapshot else None,
+            "load_seconds": snapshot.load_seconds if snapshot else None,
+            "from_cache": snapshot.from_cache if snapshot else None,
+            "error": _errors.get(name),
+        }
+    return result
+
+
+# --- Startup loading ---
+# Datasets are loaded on a background thread once the app is up, so importing
+# main.py does not run any SQL. The loads are independent network-bound
+# queries, so they run concurrently and cold start costs roughly the slowest
+# one rather than the sum. Failed loads are retried until they succeed.
+RETRY_SECONDS = int(os.environ.get("SNAPSHOT_RETRY_SECONDS", 30))
+LOAD_WORKERS = int(os.environ.get("SNAPSHOT_LOAD_WORKERS", 4))
+
+_errors = {}
+_loader = None
+
+
+def _load_one(name):
+    try:
+        snapshot = get(name)
+        source = "cache" if snapshot.from_cache else "SQL"
+        print(f"Loaded snapshot {name} from {source}: {snapshot.rows} rows in {snapshot.load_seconds:.2f}s")
+        if snapshot.from_cache:
+            # Serve the cached copy right away, then catch up with SQL
+            refresh(name)
+    except Exception as e:
+        _errors[name] = str(e)
+        print(f"Error loading snapshot {name}:", e)
+
+
+def load_pending():
+    pending = [name for name in _datasets if name not in _snapshots]
+    if not pending:
+        return
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(LOAD_WORKERS, len(pending)), thread_name_prefix="snapshot-load") as pool:
+        list(pool.map(_load_one, pending))
+    print(f"Loaded {len(pending)} snapshot(s) in {time.perf_counter() - start:.2f}s")
+
+
+def _load_loop():
+    load_pending()
+    while not ready(*_datasets) and not _stop.wait(RETRY_SECONDS):
+        load_pending()
+
+
+def start_loader():
+    global _loader
+    if _loader is None or not _loader.is_alive():
+        _loader = threading.Thread(target=_load_loop, name="snapshot-loader", daemon=True)
+        _loader.start()
+    return _loader
+
+
+def load_full(dataset, fingerprint=None):
+    start = time.perf_counter()
+    frame, watermark = dataset.fetch()
+    snapshot = Snapshot(dataset.name, dataset.finish(frame), watermark, fingerprint=fingerprint)
+    snapshot.load_seconds = time.perf_counter() - start
+    return snapshot
+
+
+def load_delta(dataset, current, fingerprint=None):
+    # Replace every row of a changed key (e.g. all lines of an updated invoice)
+    start = time.perf_counter()
+    delta, watermark = dataset.fetch(since=current.watermark)
+    if delta.empty:
+        # Nothing new (e.g. only deletes, which wait for the reconcile), but
+        # keep the fingerprint just probed so the next refresh sees no change
+        snapshot = Snapshot(dataset.name, current.frame, current.watermark,
+                            full_loaded_at=current.full_loaded_at, fingerprint=fingerprint)
+        snapshot.index = current.index
+        snapshot.cube = current.cube
+        snapshot.load_seconds = time.perf_counter() - start
+        return snapshot
+    base = current.frame
+    merged = concat([base[~base[dataset.key].isin(delta[dataset.key])], delta], dataset.categories)
+    snapshot = Snapshot(dataset.name, dataset.finish(merged), max(current.watermark, watermark),
+                        full_loaded_at=current.full_loaded_at, fingerprint=fingerprint)
+    snapshot.load_seconds = time.perf_counter() - start
+    return snapshot
+
+
+def roll_over(dataset, current):
+    # Source unchanged: only move time-dependent columns (Days Overdue) to today
+    if dataset.recompute is None or current.loaded_at.date() == pd.Timestamp.now().date():
+        return current
+    snapshot = Snapshot(dataset.name, dataset.finish(current.frame.copy()), current.watermark,
+                        full_loaded_at=current.full_loaded_at, fingerprint=current.fingerprint)
+    # Same rows in the same order, and Days Overdue is not a cube measure
+    snapshot.index = current.index
+    snapshot.cube = current.cube
+    return snapshot
+
+
+# --- Background refresh ---
+# Every loaded snapshot is rebuilt off the request path and swapped in with a
+# single assignment, so callbacks keep reading the previous complete frame
+# until the new one is ready. Set SNAPSHOT_REFRESH_SECONDS=0 to disable.
+REFRESH_SECONDS = int(os.environ.get("SNAPSHOT_REFRESH_SECONDS", 900))
+# Incremental datasets still get a full reload this often, to pick up deletes
+RECONCILE_SECONDS = int(os.environ.get("SNAPSHOT_RECONCILE_SECONDS", 6 * 3600))
+
+_refresher = None
+_stop = threading.Event()
+
+
+def refresh(name, full=False):
+    dataset = _datasets[name]
+    with _locks[name]:
+        current = _snapshots.get(name)
+        fingerprint = dataset.probe()
+        reconcile_due = current is None or \
+            (pd.Timestamp.now() - current.full_loaded_at).total_seconds() >= RECONCILE_SECONDS
+        shared = read_cache_meta(name) if not full and fingerprint is not None else None
+        if shared and shared["fingerprint"] == fingerprint and \
+                (current is None or shared["version"] > current.version):
+            # Another worker already loaded this data: map its file instead
+            snapshot = read_cache(name, max_age=None) or load_full(dataset, fingerprint)
+            snapshot = roll_over(dataset, snapshot)
+        elif not full and current is not None and fingerprint is not None and fingerprint == current.fingerprint:
+            snapshot = roll_over(dataset, current)
+        elif full or reconcile_due or current.watermark is None or not dataset.incremental():
+            snapshot = load_full(dataset, fingerprint)
+        else:
+            snapshot = load_delta(dataset, current, fingerprint)
+        if snapshot is not current and not snapshot.from_cache:
+            snapshot = publish(snapshot)
+        install(name, snapshot)
+    return snapshot
+
+
+def refresh_loaded():
+    for name in list(_snapshots):
+        try:
+            refresh(name)
+        except Exception as e:
+            print(f"Error refreshing snapshot {name}:", e)
+
+
+def _refresh_loop(interval):
+    while not _stop.wait(interval):
+        refresh_loaded()
+
+
+def start_refresher(interval=REFRESH_SECONDS):
+    global _refresher
+    if interval <= 0 or (_refresher is not None and _refresher.is_alive()):
+        return _refresher
+    _stop.clear()
+    _refresher = threading.Thread(target=_refresh_loop, args=(interval,), name="snapshot-refresher", daemon=True)
+    _refresher.start()
+    return _refresher
+
+
+def stop_refresher():
+    _stop.set()
+
+
+# --- On-disk cache ---
+# Every snapshot loaded from SQL is also written to SNAPSHOT_CACHE_DIR as an
+# uncompressed Arrow IPC file carrying its version, watermark and probe
+# fingerprint. A new process (restart, extra gunicorn worker) starts from that
+# file when it is younger than SNAPSHOT_CACHE_MAX_AGE seconds and refreshes
+# from SQL in the background. Set SNAPSHOT_CACHE_DIR to an empty string to
+# disable.
+#
+# The files are memory-mapped and to_pandas() builds the frames on top of the
+# mapping where it can: numeric and datetime columns without nulls, and plain
+# string columns (Arrow-backed in pandas 3), point at the same page cache
+# pages in every worker. Categorical columns (codes and categories) and
+# numeric columns with nulls are converted, so each worker holds its own
+# copy of those. A worker that loads new data from
+# SQL publishes it (write, then map) and the other workers adopt the file on
+# their next refresh when its fingerprint matches what they probed.
+CACHE_DIR = os.environ.get("SNAPSHOT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot_cache"))
+CACHE_MAX_AGE = int(os.environ.get("SNAPSHOT_CACHE_MAX_AGE", 24 * 3600))
+
+
+def cache_path(name):
+    return os.path.join(CACHE_DIR, f"{name}.arrow")
+
+
+def write_cache(snapshot):
+    if not CACHE_DIR:
+        return
+    watermark = snapshot.watermark
+    meta = {
+        "version": snapshot.version,
+        "loaded_at": snapshot.loaded_at.isoformat(),
+        "full_loaded_at": snapshot.full_loaded_at.isoformat(),
+        "watermark": watermark.isoformat() if isinstance(watermark, datetime) else watermark,
+        "watermark_is_datetime": isinstance(watermark, datetime),
+        "fingerprint": snapshot.fingerprint,
+    }
+    path = cache_path(snapshot.name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(snapshot.frame, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, b"snapshot": json.dumps(meta).encode()})
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)  # readers never see a half-written file; mapped old files stay valid
+        return True
+    except Exception as e:
+        print(f"Error writing snapshot cache {snapshot.name}:", e)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+
+def read_cache_meta(name):
+    path = cache_path(name) if CACHE_DIR else None
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path) as source:
+            meta = json.loads(pa.ipc.open_file(source).schema.metadata[b"snapshot"])
+    except Exception as e:
+        print(f"Error reading snapshot cache {name}:", e)
+        return None
+    if meta["fingerprint"] is not None:
+        meta["fingerprint"] = tuple(tuple(row) for row in meta["fingerprint"])
+    return meta
+
+
+def read_cache(name, max_age=CACHE_MAX_AGE):
+    path = cache_path(name) if CACHE_DIR else None
+    if not path or not os.path.exists(path):
+        return None
+    start = time.perf_counter()
+    try:
+        # The mapping stays open for as long as the frame references it
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        meta = json.loads(table.schema.metadata[b"snapshot"])
+        loaded_at = pd.Timestamp(meta["loaded_at"])
+        if max_age is not None and (pd.Timestamp.now() - loaded_at).total_seconds() > max_age:
+            print(f"Snapshot cache {name} is older than {max_age}s, ignoring it")
+            return None
+        watermark = meta["watermark"]
+        if meta["watermark_is_datetime"] and watermark is not None:
+            watermark = datetime.fromisoformat(watermark)
+        fingerprint = meta["fingerprint"]
+        if fingerprint is not None:
+            fingerprint = tuple(tuple(row) for row in fingerprint)
+        frame = table.to_pandas(split_blocks=True)
+        snapshot = Snapshot(name, frame, watermark, pd.Timestamp(meta["full_loaded_at"]), fingerprint)
+    except Exception as e:
+        print(f"Error reading snapshot cache {name}:", e)
+        return None
+    # Keep the data version of the copy that was written
+    snapshot.loaded_at = loaded_at
+    snapshot.version = meta["version"]
+    snapshot.load_seconds = time.perf_counter() - start
+    snapshot.from_cache = True
+    return snapshot
+
+
+def publish(snapshot):
+    # Write a freshly loaded snapshot and serve it from the mapped file, which
+    # releases the private copy and lets other workers share the pages
+    if not write_cache(snapshot):
+        return snapshot
+    mapped = read_cache(snapshot.name, max_age=None)
+    if mapped is None or mapped.version != snapshot.version:
+        return snapshot
+    mapped.load_seconds = snapshot.load_seconds
+    mapped.from_cache = False
+    mapped.index = snapshot.index
+    mapped.cube = snapshot.cube
+    return mapped
+
+
+def memory():
+    # Resident memory of this worker, split into private (anonymous) and
+    # shared (file-backed, incl. mapped snapshots); Pss divides shared pages
+    # by the number of processes mapping them, so summing Pss over all
+    # workers gives the real total
+    usage = {"pid": os.getpid()}
+    for path in ("/proc/self/smaps_rollup", "/proc/self/status"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in ("Rss", "Pss", "Pss_Anon", "Pss_File", "RssAnon", "RssFile"):
+                        usage[key + "_kb"] = int(value.split()[0])
+        except OSError:
+            pass
+    usage["snapshots"] = {
+        name: {
+            "frame_bytes": int(snapshot.frame.memory_usage(deep=True).sum()),
+            "file_bytes": os.path.getsize(cache_path(name)) if CACHE_DIR and os.path.exists(cache_path(name)) else None,
+        }
+        for name, snapshot in list(_snapshots.items())
+    }
+    return usage
+
+
+def bake():
+    # Load every dataset from SQL and write it to the cache, e.g. at image build
+    for name, dataset in _datasets.items():
+        snapshot = load_full(dataset, dataset.probe())
+        write_cache(snapshot)
+        print(f"Baked snapshot {name}: {snapshot.rows} rows -> {cache_path(name)}")
+
+
+# --- INVOICES ---
+def prepare_invoices(df):
+    df['Invoice_Date'] = pd.to_datetime(df['Invoice_Date'], errors='coerce')
+    df = df[df['Invoice_Date'].notna()].copy()  # remove rows with invalid dates
+
+    df['Year'] = df['Invoice_Date'].dt.year.astype('int16')
+    df['Month'] = df['Invoice_Date'].dt.month_name()
+    df['Quarter'] = "Q" + df['Invoice_Date'].dt.quarter.astype(str)
+
+    # MP is shown as is on the detail pages (blank when there is none); only
+    # Location, a cube dimension grouped on by Overview, gets a fill value
+    df['MP'] = df['Location']
+    df['Location'] = df['Location'].fillna("Unknown")
+    df['Name'] = df.pop('Client_Name').fillna("")
+
+    df['Invoice_Amount_USD'] = pd.to_numeric(df['Invoice_Amount_USD'], errors='coerce')
+    df['Paid_Amount'] = df['Invoice_Amount_USD'] - df['Quantity']
+
+    # Outstanding amount of authorised invoices that are not fully paid yet
+    df['Invoice_DueDate'] = pd.to_datetime(df['Invoice_DueDate'], errors='coerce')
+    unpaid = (df['Status'] == 'AUTHORISED') & df['FullyPaidOnDate'].isna()
+    df['Receivables'] = df['Invoice_Amount_USD'].where(unpaid, 0).astype(float)
+    return df
+
+
+def update_days_overdue(df):
+    today = pd.to_datetime(pd.Timestamp.now().date())
+    df['Days Overdue'] = (today - df['Invoice_DueDate']).dt.days.clip(lower=0)
+    return df
+
+
+register(Dataset(
+    "invoices", "dbo.INVOICES",
+    columns=[
+        "Invoice_Date", "Invoice_DueDate", "Location", "Invoice_Entity", "Invoice_Amount_USD", "Quantity",
+        "Client_Name", "Description", "Status", "FullyPaidOnDate",
+    ],
+    where="[Invoice_Date] IS NOT NULL",
+    prepare=prepare_invoices,
+    categories=["Location", "MP", "Invoice_Entity", "Month", "Quarter", "Status", "Name", "Description"],
+    indexed=["Year", "Month", "Quarter", "Invoice_Entity", "Location", "MP"],
+    cube=(["Location", "Invoice_Entity", "Year", "Quarter", "Month"], ["Invoice_Amount_USD", "Paid_Amount", "Quantity"]),
+    recompute=update_days_overdue,
+    key=os.environ.get("INVOICES_KEY_COLUMN", "InvoiceID"),
+    watermark=os.environ.get("INVOICES_WATERMARK_COLUMN", "UpdatedDateUTC"),
+))
+
+
+def invoices():
+    return get("invoices").frame
+
+
+# --- DEALS ---
+closed_stages = ['Closed (Lost)', 'Closed (Future prospect)', 'Implementation', 'On-Going Services', 'Engagement Completed']
+
+
+def prepare_deals(df):
+    # Only active deals are shown on the pipeline pages
+    df['Status'] = df['Status'].astype(str).str.strip().str.lower()
+    df = df[df['Status'] == 'active'].copy()
+
+    owner = df['Deal Owner Name'].fillna('').astype(str).str.strip()
+    df['Deal Owner Name'] = owner.replace('', 'Unknown')
+    df['Stage'] = df['Stage'].fillna('')
+    df['Is Closed'] = df['Stage'].isin(closed_stages)
+
+    # Money columns arrive as text such as "$1,200"
+    for col in ["Amount", "Consulting Fee"]:
+        if col in df.columns:
+            cleaned = df[col].astype(str).str.replace(r'[$,]', '', regex=True)
+            df[col] = pd.to_numeric(cleaned, errors='coerce').fillna(0)
+
+    df['Created Time'] = pd.to_datetime(df['Created Time'], errors='coerce')
+    df['Closing Date'] = pd.to_datetime(df['Closing Date'], errors='coerce')
+    df['Closing Month'] = df['Closing Date'].dt.strftime("%Y-%m")
+    return df
+
+
+register(Dataset(
+    "deals", "dbo.DEALS",
+    columns=[
+        "Status", "Deal Owner Name", "Deal Name", "Stage", "Closing Date", "Created Time", "Amount",
+        "Consulting Fee", "Service Line", "Lead Source", "Billing Company", "Sales Cycle Duration",
+    ],
+    optional_columns=["Region"],
+    where="LOWER(LTRIM(RTRIM([Status]))) = 'active'",
+    prepare=prepare_deals,
+    indexed=["Deal Owner Name", "Stage", "Service Line", "Lead Source", "Billing Company", "Region", "Closing Month"],
+    cube=(
+        ["Deal Owner Name", "Stage", "Service Line", "Lead Source", "Billing Company", "Region", "Closing Month"],
+        ["Amount", "Consulting Fee"],
+    ),
+    categories=[
+        "Status", "Deal Owner Name", "Deal Name", "Stage", "Service Line", "Lead Source", "Billing Company",
+        "Region", "Closing Month",
+    ],
+    key=os.environ.get("DEALS_KEY_COLUMN"),
+    watermark=os.environ.get("DEALS_WATERMARK_COLUMN"),
+))
+
+
+def deals():
+    return get("deals").frame
+
+
+# --- Commission dropdown options ---
+# Every person/department that appears in the five commission tables, loaded in
+# one round trip as (Kind, Value) rows.
+COMMISSION_OPTIONS_SQL = """
+    SELECT DISTINCT [Kind], TRIM([Value]) AS [Value] FROM (
+        SELECT 'location' AS [Kind], [Location] AS [Value] FROM [dbo].[MP/MD COMMISSIONS]
+        UNION ALL SELECT 'location', [Location] FROM [dbo].[MP as PM COMMISSION]
+        UNION ALL SELECT 'location', [Location] FROM [dbo].[PRACTICE_MP]
+        UNION ALL SELECT 'location', [Location] FROM [dbo].[3RD_PARTY COMMISSION]
+        UNION ALL SELECT 'location', [Location] FROM [dbo].[PRACTICE_MD]
+        UNION ALL SELECT 'department', [Department] FROM [dbo].[MP/MD COMMISSIONS]
+        UNION ALL SELECT 'practice_mp', [Practice MP Name] FROM [dbo].[PRACTICE_MP]
+        UNION ALL SELECT 'practice_md', [Practice_MD_Name] FROM [dbo].[PRACTICE_MD]
+        UNION ALL SELECT 'mp_as_pm', [MP as PM] FROM [dbo].[MP as PM COMMISSION]
+    ) AS AllOptions
+    WHERE [Value] IS NOT NULL AND TRIM([Value]) <> ''
+"""
+
+COMMISSION_OPTIONS_PROBE_SQL = """
+    SELECT 'MP/MD COMMISSIONS' AS [Source], COUNT_BIG(*) AS row_count,
+           CHECKSUM_AGG(BINARY_CHECKSUM([Location], [Department])) AS fingerprint
+    FROM [dbo].[MP/MD COMMISSIONS]
+    UNION ALL SELECT 'MP as PM COMMISSION', COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM([Location], [MP as PM]))
+    FROM [dbo].[MP as PM COMMISSION]
+    UNION ALL SELECT 'PRACTICE_MP', COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM([Location], [Practice MP Name]))
+    FROM [dbo].[PRACTICE_MP]
+    UNION ALL SELECT '3RD_PARTY COMMISSION', COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM([Location]))
+    FROM [dbo].[3RD_PARTY COMMISSION]
+    UNION ALL SELECT 'PRACTICE_MD', COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM([Location], [Practice_MD_Name]))
+    FROM [dbo].[PRACTICE_MD]
+"""
+
+
+def prepare_commission_options(df):
+    df['Value'] = df['Value'].str.strip()
+    return df.drop_duplicates()
+
+
+register(Dataset(
+    "commission_options",
+    sql=COMMISSION_OPTIONS_SQL,
+    probe_sql=COMMISSION_OPTIONS_PROBE_SQL,
+    prepare=prepare_commission_options,
+))
+
+
+def commission_options(kind):
+    # Read from layout and sidebar code, so it never loads: until the loader
+    # has installed the snapshot there are no options
+    snapshot = _snapshots.get("commission_options")
+    if snapshot is None:
+        return []
+    df = snapshot.frame
+    values = sorted(df.loc[df['Kind'] == kind, 'Value'].unique())
+    return [{'label': value, 'value': value} for value in values]
+
+
+# --- Commission ledger ---
+# Monthly commission totals per role and person from the five commission
+# tables: one row per (Part, Person, Year, Month), where Part is the position
+# of the role in Commission_Detail.COMMISSION_PARTS (MP, MD, Practice MP,
+# Practice MD, MP as PM, 3rd Party). The Commission Details KPI cards are sums
+# over these rows, so they never need the detail rows.
+COMMISSION_LEDGER_SQL = """
+    SELECT 0 AS [Part], TRIM([Location]) AS [Person], YEAR([Invoice_Date]) AS [Year], MONTH([Invoice_Date]) AS [Month],
+           SUM([MP_Commission]) AS [Commission], COUNT_BIG(*) AS [Rows]
+    FROM [dbo].[MP/MD COMMISSIONS]
+    GROUP BY TRIM([Location]), YEAR([Invoice_Date]), MONTH([Invoice_Date])
+    UNION ALL
+    SELECT 1, TRIM([Department]), YEAR([Invoice_Date]), MONTH([Invoice_Date]), SUM([MD_Commission]), COUNT_BIG(*)
+    FROM [dbo].[MP/MD COMMISSIONS]
+    GROUP BY TRIM([Department]), YEAR([Invoice_Date]), MONTH([Invoice_Date])
+    UNION ALL
+    SELECT 2, TRIM([Practice MP Name]), YEAR([Invoice_Date]), MONTH([Invoice_Date]), SUM([MP_Commission]), COUNT_BIG(*)
+    FROM [dbo].[PRACTICE_MP]
+    GROUP BY TRIM([Practice MP Name]), YEAR([Invoice_Date]), MONTH([Invoice_Date])
+    UNION ALL
+    SELECT 3, TRIM([Practice_MD_Name]), YEAR([Invoice_Date]), MONTH([Invoice_Date]), SUM([Practice MD Commission]), COUNT_BIG(*)
+    FROM [dbo].[PRACTICE_MD]
+    GROUP BY TRIM([Practice_MD_Name]), YEAR([Invoice_Date]), MONTH([Invoice_Date])
+    UNION ALL
+    SELECT 4, TRIM([MP as PM]), YEAR([Invoice_Date]), MONTH([Invoice_Date]), SUM([MP as PM Commission]), COUNT_BIG(*)
+    FROM [dbo].[MP as PM COMMISSION]
+    GROUP BY TRIM([MP as PM]), YEAR([Invoice_Date]), MONTH([Invoice_Date])
+    UNION ALL
+    SELECT 5, TRIM([Location]), YEAR([Invoice_Date]), MONTH([Invoice_Date]), SUM([3rd Party Payout 1]), COUNT_BIG(*)
+    FROM [dbo].[3RD_PARTY COMMISSION]
+    GROUP BY TRIM([Location]), YEAR([Invoice_Date]), MONTH([Invoice_Date])
+"""
+
+COMMISSION_LEDGER_PROBE_SQL = """
+    SELECT 'MP/MD COMMISSIONS' AS [Source], COUNT_BIG(*) AS row_count,
+           CHECKSUM_AGG(BINARY_CHECKSUM([Invoice_Date], [Location], [Department], [MP_Commission], [MD_Commission])) AS fingerprint
+    FROM [dbo].[MP/MD COMMISSIONS]
+    UNION ALL SELECT 'PRACTICE_MP', COUNT_BIG(*),
+           CHECKSUM_AGG(BINARY_CHECKSUM([Invoice_Date], [Practice MP Name], [MP_Commission]))
+    FROM [dbo].[PRACTICE_MP]
+    UNION ALL SELECT 'PRACTICE_MD', COUNT_BIG(*),
+           CHECKSUM_AGG(BINARY_CHECKSUM([Invoice_Date], [Practice_MD_Name], [Practice MD Commission]))
+    FROM [dbo].[PRACTICE_MD]
+    UNION ALL SELECT 'MP as PM COMMISSION', COUNT_BIG(*),
+           CHECKSUM_AGG(BINARY_CHECKSUM([Invoice_Date], [MP as PM], [MP as PM Commission]))
+    FROM [dbo].[MP as PM COMMISSION]
+    UNION ALL SELECT '3RD_PARTY COMMISSION', COUNT_BIG(*),
+           CHECKSUM_AGG(BINARY_CHECKSUM([Invoice_Date], [Location], [3rd Party Payout 1]))
+    FROM [dbo].[3RD_PARTY COMMISSION]
+"""
+
+
+def prepare_commission_ledger(df):
+    # Rows without an invoice date never fall in a month
+    df = df.dropna(subset=['Year', 'Month'])
+    df['Part'] = df['Part'].astype('int8')
+    df['Year'] = df['Year'].astype('int16')
+    df['Month'] = df['Month'].astype('int8')
+    df['Person'] = df['Person'].fillna("")
+    return df
+
+
+register(Dataset(
+    "commission_ledger",
+    sql=COMMISSION_LEDGER_SQL,
+    probe_sql=COMMISSION_LEDGER_PROBE_SQL,
+    prepare=prepare_commission_ledger,
+    categories=("Person",),
+))
+
+
+def commission_ledger():
+    return get("commission_ledger").frame
+
+
+# python snapshots.py bake  -> write all snapshots to SNAPSHOT_CACHE_DIR
+if __name__ == "__main__":
+    if sys.argv[1:] != ["bake"]:
+        sys.exit("usage: python snapshots.py bake")
+    bake()
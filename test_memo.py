@@ -0,0 +1,56 @@
+import pytest
+
+import memo
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    memo.clear()
+    yield
+    memo.clear()
+
+
+def test_normalize_keeps_argument_positions():
+    assert memo.normalize((3, "2024", 2, None)) != memo.normalize((2, "2024", 3, None))
+    assert memo.normalize(("Pia Roy", None)) != memo.normalize((None, "Pia Roy"))
+
+
+def test_normalize_ignores_multi_select_order():
+    assert memo.normalize(["b", "a"]) == memo.normalize(["a", "b"])
+    assert memo.normalize({"username": "admin", "x": [2, 1]}) == memo.normalize({"x": [1, 2], "username": "admin"})
+
+
+def test_swapped_positional_arguments_are_separate_entries():
+    calls = []
+
+    @memo.memoize()
+    def table(part, year, month, person):
+        calls.append((part, year, month, person))
+        return {"part": part, "month": month}
+
+    assert table(2, "2024", 3, None) == {"part": 2, "month": 3}
+    assert table(3, "2024", 2, None) == {"part": 3, "month": 2}
+    assert len(calls) == 2
+
+
+def test_same_person_in_different_dropdowns():
+    @memo.memoize()
+    def kpis(mp, md, third_party):
+        return [mp, md, third_party]
+
+    assert kpis("Pia Roy", None, None) == ["Pia Roy", None, None]
+    assert kpis(None, "Pia Roy", None) == [None, "Pia Roy", None]
+    assert kpis(None, None, "Pia Roy") == [None, None, "Pia Roy"]
+
+
+def test_repeat_call_is_a_hit():
+    @memo.memoize()
+    def options(values):
+        return sorted(values)
+
+    before = memo.stats()
+    options(["b", "a"])
+    options(["a", "b"])
+    after = memo.stats()
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 1
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import snapshots
+
+NAME = "test_invoices"
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(7)
+    rows = 1003  # not a multiple of 8, so the packed bitmaps have padding bits
+    frame = pd.DataFrame({
+        "Year": rng.choice([2014, 2015, 2016, 2017], rows).astype("int16"),
+        "Month": pd.Categorical(rng.choice(["January", "February", "March"], rows)),
+        "Invoice_Entity": pd.Categorical(rng.choice(["Valenta AU", "Valenta UK", None], rows)),
+        "Location": rng.choice(["Pia Roy", "Tim Charles", "Unknown"], rows),
+        "Invoice_Amount_USD": rng.uniform(-100, 5000, rows).round(2),
+    })
+    snapshots.register(snapshots.Dataset(
+        NAME,
+        indexed=["Year", "Month", "Invoice_Entity", "Location"],
+        cube=(["Location", "Invoice_Entity", "Year", "Month"], ["Invoice_Amount_USD"]),
+    ))
+    snapshots.install(NAME, snapshots.Snapshot(NAME, frame))
+    yield frame
+    snapshots._snapshots.pop(NAME, None)
+    snapshots._datasets.pop(NAME, None)
+    snapshots._locks.pop(NAME, None)
+
+
+FILTERS = [
+    [],
+    [("Year", [2015])],
+    [("Year", [2014, 2017]), ("Month", ["March"])],
+    [("Invoice_Entity", ["Valenta UK"]), ("Location", ["Pia Roy", "Tim Charles"])],
+    [("Location", ["Pia Roy"]), ("Year", None), ("Month", ["January", "February"])],
+    [("Location", ["Nobody"])],
+]
+
+
+def expected_rows(frame, filters):
+    mask = pd.Series(True, index=frame.index)
+    for col, values in filters:
+        if values is None:
+            continue
+        mask &= values(frame[col]) if callable(values) else frame[col].isin(values)
+    return frame[mask]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_select_matches_pandas(frame, filters):
+    result = snapshots.select(NAME, filters, columns=["Location", "Invoice_Amount_USD"])
+    expected = expected_rows(frame, filters)[["Location", "Invoice_Amount_USD"]]
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_select_with_predicate(frame):
+    filters = [("Invoice_Amount_USD", snapshots.between(100, 1000)), ("Year", [2016])]
+    result = snapshots.select(NAME, filters)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True),
+                                  expected_rows(frame, filters).reset_index(drop=True))
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_cube_select_matches_pandas(frame, filters):
+    cells = snapshots.cube_select(NAME, filters)
+    expected = expected_rows(frame, filters)
+    assert cells["Rows"].sum() == len(expected)
+    assert cells["Invoice_Amount_USD"].sum() == pytest.approx(expected["Invoice_Amount_USD"].sum())
+    by_location = cells.groupby("Location")["Invoice_Amount_USD"].sum()
+    expected_by_location = expected.groupby("Location")["Invoice_Amount_USD"].sum()
+    pd.testing.assert_series_equal(by_location, expected_by_location, check_names=False)
+
+
+def test_cube_keeps_rows_without_entity(frame):
+    cells = snapshots.cube_select(NAME, [])
+    assert cells["Rows"].sum() == len(frame)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_facets_match_pandas(frame, filters):
+    columns = ["Year", "Month", "Location"]
+    counts = snapshots.facets(NAME, filters, columns)
+    for col in columns:
+        # A dropdown's own selection does not narrow its options
+        others = [(other, values) for other, values in filters if other != col]
+        expected = expected_rows(frame, others)[col].value_counts()
+        assert counts[col] == {value: n for value, n in expected.items() if n}